@@ -0,0 +1,288 @@
+import json
+import os
+import stat
+import threading
+import time
+import traceback
+import uuid
+import zlib
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: coalesce within a process only
+    fcntl = None
+
+class LRUCache:
+    """
+    Thread-safe mapping with a maximum size, evicting the least recently used entry.
+    With ttl set, entries also expire ttl seconds after they were set.
+    """
+    def __init__(self, maxsize=256, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        # key -> (expiry time or None, value)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def live_entry(self, key):
+        """The entry for key, dropping it if it has expired; call with the lock held"""
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] is not None and self.clock() >= entry[0]:
+            del self.entries[key]
+            return None
+        return entry
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.live_entry(key)
+            if entry is None:
+                return default
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            expires = self.clock() + self.ttl if self.ttl is not None else None
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.live_entry(key)
+            if entry is None:
+                return default
+            del self.entries[key]
+            return entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __contains__(self, key):
+        with self.lock:
+            return self.live_entry(key) is not None
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+def private_dir(path):
+    """
+    Create path as a directory only this user can use, or check that it already is one.
+    Raises PermissionError for anything else, such as a directory another local user
+    created first. Returns path.
+    """
+    try:
+        os.makedirs(path, mode=0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError(f"{path} is not a directory")
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        raise PermissionError(f"{path} is owned by another user")
+    if info.st_mode & 0o077:
+        raise PermissionError(f"{path} can be used by other users (mode {stat.S_IMODE(info.st_mode):o})")
+    return path
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time.
+    Threads asking for a key that is already being computed wait for that call and
+    share its result (or its exception) instead of starting their own.
+
+    With lock_dir set (a private_dir), callers can also pass a shared_key and
+    shared_version to coordinate across worker processes: the computation runs under an
+    exclusive lock file, and the leader publishes its result as JSON next to the lock. A
+    process that had to wait for the lock reuses that result if it was published while it
+    waited, for the same shared_key and shared_version, just like a thread joining an
+    in-flight call. Results shared this way must be JSON-serializable. Keys share one of
+    stripes lock and result files, so the directory holds a bounded number of files.
+    """
+    def __init__(self, lock_dir=None, stripes=64):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.stripes = stripes
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn, shared_key=None, shared_version=None):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {"done": threading.Event(), "result": None, "error": None}
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            if self.lock_dir is not None and shared_key is not None:
+                call["result"] = self.run_locked(shared_key, shared_version, fn)
+            else:
+                call["result"] = fn()
+            return call["result"]
+        except Exception as err:
+            call["error"] = err
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call["done"].set()
+
+    def run_locked(self, shared_key, shared_version, fn):
+        stripe = zlib.crc32(shared_key.encode()) % self.stripes
+        lock_path = os.path.join(self.lock_dir, f"stripe-{stripe}.lock")
+        result_path = os.path.join(self.lock_dir, f"stripe-{stripe}.json")
+        tag = json.dumps([shared_key, shared_version])
+        waiting_since = time.time()
+        with open(lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    if os.path.getmtime(result_path) >= waiting_since:
+                        with open(result_path) as f:
+                            published = json.load(f)
+                        if published["tag"] == tag:
+                            return published["result"]
+                except (OSError, ValueError, KeyError, TypeError):
+                    pass
+
+                result = fn()
+                tmp_path = f"{result_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump({"tag": tag, "result": result}, f)
+                os.replace(tmp_path, result_path)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class LocalVersions:
+    """Version counters kept in this process; bumps made by other worker processes go unseen"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.versions = {}
+
+    def get(self, name):
+        with self.lock:
+            return self.versions.get(name, 0)
+
+    def bump(self, name):
+        with self.lock:
+            self.versions[name] = self.versions.get(name, 0) + 1
+
+class SharedVersions:
+    """
+    Versions kept as files in a directory (a private_dir), so every worker process sees
+    the bumps made by the others. A version is the random token last written to its file; each bump replaces
+    the file in one rename, so readers never see a partly written token.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, name):
+        return os.path.join(self.directory, f"{name}.version")
+
+    def get(self, name):
+        try:
+            with open(self.path(name)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def bump(self, name):
+        path = self.path(name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(tmp_path, path)
+
+class ResultsCache:
+    """
+    Computed poll results, kept per poll alongside the poll's vote version.
+
+    Writes bump the version (bump for one poll, bump_all after changes that touch many
+    polls). Versions live in versions, a LocalVersions by default; pass a SharedVersions
+    so that bumps made by one worker process are seen by all of them. An entry whose
+    version is out of date is recomputed before returning, so voters see their own vote.
+    An entry that is current but older than ttl seconds (the ttl bounds how long votes
+    written without a bump go unnoticed) is still served for up to stale_budget seconds
+    while a background thread recomputes it. Past that, or with stale_budget=0, the
+    caller recomputes before returning.
+
+    Recomputes go through single_flight (a SingleFlight), so concurrent requests
+    for the same poll and version in this process share one computation.
+    """
+    def __init__(self, maxsize=256, ttl=30, stale_budget=5, clock=time.monotonic, single_flight=None, versions=None):
+        self.entries = LRUCache(maxsize)
+        self.single_flight = single_flight or SingleFlight()
+        self.versions = versions or LocalVersions()
+        self.ttl = ttl
+        self.stale_budget = stale_budget
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.refreshing = set()
+
+    def version(self, poll_id):
+        return (self.versions.get("all"), self.versions.get(f"poll-{poll_id}"))
+
+    def bump(self, poll_id):
+        """Mark a poll's results as out of date after its votes changed"""
+        self.versions.bump(f"poll-{poll_id}")
+
+    def bump_all(self):
+        """Mark every poll's results as out of date, e.g. after deleting a user's votes"""
+        self.versions.bump("all")
+
+    def discard(self, poll_id):
+        """Drop a poll's results entirely so they are never served stale, e.g. after deletion"""
+        self.bump(poll_id)
+        self.entries.pop(poll_id)
+
+    def compute(self, poll_id, compute):
+        version = self.version(poll_id)
+
+        def compute_and_store():
+            computed_at = self.clock()
+            value = compute()
+            self.entries.set(poll_id, (version, computed_at, value))
+            return value
+
+        return self.single_flight.do((poll_id, version), compute_and_store)
+
+    def refresh_in_background(self, poll_id, compute):
+        with self.lock:
+            if poll_id in self.refreshing:
+                return
+            self.refreshing.add(poll_id)
+
+        def refresh():
+            try:
+                self.compute(poll_id, compute)
+            except Exception:
+                print(traceback.format_exc())
+            finally:
+                with self.lock:
+                    self.refreshing.discard(poll_id)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get_or_compute(self, poll_id, compute):
+        entry = self.entries.get(poll_id)
+        if entry is None or entry[0] != self.version(poll_id):
+            return self.compute(poll_id, compute)
+
+        version, computed_at, value = entry
+        age = self.clock() - computed_at
+        if age < self.ttl:
+            return value
+        if age < self.ttl + self.stale_budget:
+            self.refresh_in_background(poll_id, compute)
+            return value
+        return self.compute(poll_id, compute)
@@ -1,3 +1,5 @@
+import os
+
 EMAIL = "email"
 TITLE = "title"
 COVER_URL = "cover_url"
@@ -10,4 +12,36 @@ LOGIN = "login"
 EMAIL_VERIFICATION = "email_verification"
 SELECTED = "selected"
 ID = "id"
-VERIFICATION_CODE = "verification_code"
\ No newline at end of file
+VERIFICATION_CODE = "verification_code"
+# submit_ballot statuses
+BALLOT_SAVED = "saved"
+BALLOT_EMAIL_REQUIRED = "email_required"
+BALLOT_UNKNOWN_USER = "unknown_user"
+BALLOT_VERIFICATION_REQUIRED = "verification_required"
+
+# Results cache: number of polls kept, seconds results stay fresh while their votes are
+# unchanged, and seconds results past that may still be served while they are recomputed
+# in the background (results are always recomputed right away once votes change)
+RESULTS_CACHE_SIZE = 256
+RESULTS_CACHE_TTL = 30
+RESULTS_CACHE_STALE_BUDGET = 5
+# Directory for the lock files that let gunicorn workers share one results computation per
+# poll, and for the vote version files that tell every worker when a poll's votes changed.
+# It must be private to the app's user: under systemd it goes in the service's
+# RuntimeDirectory, elsewhere in /tmp, where a directory another user created is refused.
+RESULTS_LOCK_DIR = os.path.join(os.environ["RUNTIME_DIRECTORY"], "results") if "RUNTIME_DIRECTORY" in os.environ else "/tmp/approvalvote-results"
+# Tally engine for the excess vote method: "bitmask" or "sets", which count exactly, or "numpy",
+# which is faster on large polls but compares vote counts with a float tolerance, so near-ties
+# can come out differently (falls back to bitmask when numpy is missing)
+TALLY_ENGINE = "bitmask"
+# Seconds browsers and proxies may reuse the vote page before revalidating it with its ETag
+POLL_PAGE_MAX_AGE = 300
+# Poll definition cache: number of polls' details and options kept per worker, and seconds
+# before an entry is re-read (bounds how long a poll deleted by another worker is still served)
+POLL_CACHE_SIZE = 1024
+POLL_CACHE_TTL = 300
+# Email -> user ID cache: number of users kept per worker, and seconds before an entry is re-read
+USER_ID_CACHE_SIZE = 4096
+USER_ID_CACHE_TTL = 300
+# Polls shown per dashboard page
+DASHBOARD_PAGE_SIZE = 50
@@ -1,19 +1,129 @@
 from supabase import Client
-from constants import EMAIL
+from constants import EMAIL, BALLOT_SAVED, POLL_CACHE_SIZE, POLL_CACHE_TTL, USER_ID_CACHE_SIZE, USER_ID_CACHE_TTL, DASHBOARD_PAGE_SIZE
+from cache import LRUCache
+from voter_index import VoterIndex
+
+# Rows requested per page when paging through Votes or Ballots. PostgREST caps pages at its
+# max-rows setting (1000 by default on Supabase), so a page can come back shorter than this
+# without being the last one.
+VOTES_PAGE_SIZE = 1000
+
+class PollSnapshot:
+    """
+    Options and votes for a poll, read once and indexed in memory.
+    Provides everything the results, comparison and CSV views need:
+    - candidate_text: option ID -> option text, sorted by ID
+    - candidates: option ID -> VoterSet of user IDs who approved it
+    - voter_index: the VoterIndex the candidates' VoterSets number voters with
+    - ballot_counts: frozenset of option IDs -> number of voters who cast that ballot
+    - user_votes: user ID -> {"timestamp", "user_id", "votes"} for CSV export
+    - stored_results: option ID -> (winner, vote_tally) as last saved by save_poll_results
+    votes can be any iterable of Votes rows and is consumed one row at a time.
+    from_ballots builds one from ballots the database already aggregated instead.
+    """
+    def __init__(self, poll_id, options, votes):
+        self.poll_id = poll_id
+        self.option_map = {item["id"]: item["option"] for item in options}
+        self.stored_results = {item["id"]: (item.get("winner"), item.get("vote_tally")) for item in options}
+        self.candidate_text = dict(sorted(self.option_map.items()))
+        self.voter_index = VoterIndex()
+        candidate_rows = {int(item["id"]): [] for item in options}
+        self.user_votes = {}
+
+        for vote in votes:
+            user_id = vote["user"]
+            option_id = vote["option"]
+            timestamp = vote.get("created_at")
+            if option_id in candidate_rows:
+                candidate_rows[option_id].append(self.voter_index.row(user_id))
+            if user_id not in self.user_votes:
+                self.user_votes[user_id] = {
+                    "timestamp": timestamp,
+                    "user_id": user_id,
+                    "votes": set()
+                }
+            elif timestamp is not None and timestamp < self.user_votes[user_id]["timestamp"]:
+                # Keep the earliest timestamp for this user
+                self.user_votes[user_id]["timestamp"] = timestamp
+            self.user_votes[user_id]["votes"].add(option_id)
+
+        self.candidates = {option_id: self.voter_index.from_rows(rows) for option_id, rows in candidate_rows.items()}
+
+        self.ballot_counts = {}
+        for user_vote in self.user_votes.values():
+            ballot_key = frozenset(user_vote["votes"])
+            self.ballot_counts[ballot_key] = self.ballot_counts.get(ballot_key, 0) + 1
+
+    @classmethod
+    def from_ballots(cls, poll_id, options, ballots):
+        """
+        Snapshot from [{"options": [option IDs], "voters": count}, ...] as returned by the
+        poll_ballots database function. Voters are anonymous: each ballot's voters get
+        consecutive rows in voter_index, so candidates have the right sizes and overlaps,
+        and user_votes is empty.
+        """
+        snapshot = cls(poll_id, options, ())
+        ballots = [(frozenset(ballot["options"]), ballot["voters"]) for ballot in ballots]
+        snapshot.voter_index.add_anonymous(sum(voters for _, voters in ballots))
+        snapshot.candidates = {
+            option_id: snapshot.voter_index.from_runs((option_id in ballot, voters) for ballot, voters in ballots)
+            for option_id in snapshot.candidates
+        }
+        for ballot, voters in ballots:
+            snapshot.ballot_counts[ballot] = snapshot.ballot_counts.get(ballot, 0) + voters
+        return snapshot
+
+    @property
+    def total_votes(self):
+        return sum(len(votes) for votes in self.candidates.values())
 
 class PollDatabase:
-    def __init__(self, supabase_client: Client):
+    def __init__(self, supabase_client: Client, results_cache=None):
         self.client = supabase_client
+        # Optional cache.ResultsCache, told whenever votes change
+        self.results_cache = results_cache
+        # Poll details and options by (kind, poll ID). Polls can't be edited after creation,
+        # so entries only go stale when a poll is deleted; the TTL bounds how long a
+        # deletion in another worker goes unnoticed.
+        self.poll_cache = LRUCache(POLL_CACHE_SIZE, ttl=POLL_CACHE_TTL)
+        # Email -> user ID for existing users. Unknown emails aren't cached, since the user
+        # may register in another worker; the TTL bounds how long a deletion there goes unnoticed.
+        self.user_ids = LRUCache(USER_ID_CACHE_SIZE, ttl=USER_ID_CACHE_TTL)
+
+    def cached_poll_data(self, kind, poll_id, fetch):
+        """fetch(), cached per poll until the TTL runs out or the poll is deleted. None is not cached."""
+        key = (kind, int(poll_id))
+        value = self.poll_cache.get(key)
+        if value is None:
+            value = fetch()
+            if value is not None:
+                self.poll_cache.set(key, value)
+        return value
+
+    def forget_poll(self, poll_id):
+        for kind in ("details", "candidates"):
+            self.poll_cache.pop((kind, int(poll_id)))
 
     def get_user_id(self, email):
+        user_id = self.user_ids.get(email)
+        if user_id is not None:
+            return user_id
         response = self.client.table("Users").select("id").eq("email", email).execute()
         if len(response.data) == 0:
             return None
-        return response.data[0]['id']
+        user_id = response.data[0]['id']
+        self.user_ids.set(email, user_id)
+        return user_id
 
     def user_exists(self, email):
         return self.get_user_id(email) is not None
 
+    def create_user(self, email, full_name, preferred_name):
+        response = self.client.table("Users").insert({"email": email, "full_name": full_name, "preferred_name": preferred_name}).execute()
+        user_id = response.data[0]['id']
+        self.user_ids.set(email, user_id)
+        return user_id
+
     def create_anonymous_user(self):
         response = self.client.table("Users").insert({}).execute()
         return response.data[0]['id']
@@ -28,40 +138,110 @@ class PollDatabase:
         return response.data[0]["form_data"] if response.data else None
 
     def get_poll_details(self, poll_id):
-        response = self.client.table("Polls").select("seats, title, description, cover_photo, email_verification").eq("id", poll_id).execute()
-        return response.data[0] if response.data else None
+        def fetch():
+            response = self.client.table("Polls").select("seats, title, description, cover_photo, email_verification, created_at").eq("id", poll_id).execute()
+            return response.data[0] if response.data else None
+        details = self.cached_poll_data("details", poll_id, fetch)
+        return dict(details) if details is not None else None
 
     def get_poll_candidates(self, poll_id):
-        response = self.client.table("PollOptions").select("id, option").eq("poll", poll_id).execute()
-        return [(row['id'], row['option']) for row in response.data]
+        def fetch():
+            response = self.client.table("PollOptions").select("id, option").eq("poll", poll_id).execute()
+            return [(row['id'], row['option']) for row in response.data] or None
+        return list(self.cached_poll_data("candidates", poll_id, fetch) or [])
 
     def get_poll_email_verification(self, poll_id):
-        response = self.client.table("Polls").select("email_verification").eq("id", poll_id).single().execute()
-        return response.data['email_verification']
+        details = self.get_poll_details(poll_id)
+        if details is None:
+            raise ValueError(f"Poll {poll_id} not found")
+        return details['email_verification']
+
+    @staticmethod
+    def option_ids(selected_options):
+        return [int(option.split("|", maxsplit=1)[0]) for option in selected_options]
 
     def save_votes(self, poll_id, user_id, selected_options):
-        # Delete existing votes
-        self.client.table("Votes").delete().eq("poll", poll_id).eq("user", user_id).execute()
-        # Save new votes
-        for option in selected_options:
-            option_id = option.split("|", maxsplit=1)[0]
-            self.client.table("Votes").insert({
-                "poll": poll_id,
-                "option": option_id,
-                "user": user_id
-            }).execute()
+        # Replace the voter's ballot with a single upsert
+        self.client.rpc("replace_ballot", {
+            "p_poll": int(poll_id),
+            "p_user": user_id,
+            "p_options": self.option_ids(selected_options)
+        }).execute()
+        if self.results_cache is not None:
+            self.results_cache.bump(int(poll_id))
+
+    def submit_ballot(self, poll_id, email, selected_options, verified=False):
+        """
+        Resolve the voter and atomically replace their ballot in one round trip.
+        Returns a dictionary with "status" (one of the BALLOT_* constants) and "user_id".
+        Anonymous voters (no email) get a new user created when the poll allows it.
+        """
+        response = self.client.rpc("submit_ballot", {
+            "p_poll": int(poll_id),
+            "p_email": email or None,
+            "p_options": self.option_ids(selected_options),
+            "p_verified": verified
+        }).execute()
+        if self.results_cache is not None and response.data["status"] == BALLOT_SAVED:
+            self.results_cache.bump(int(poll_id))
+        return response.data
+
+    def _iter_table(self, table, columns, poll_id, page_size):
+        """
+        Yield every row of table for a poll in ID order, with id and columns.
+        Pages through the table with keyset pagination on ID, so polls of any size are read
+        completely without hitting the row cap and only one page is held in memory at a time.
+        Reading stops at the first empty page, since a short page may just be the cap.
+        """
+        last_id = None
+        while True:
+            query = self.client.table(table).select(f"id, {columns}").eq("poll", poll_id)
+            if last_id is not None:
+                query = query.gt("id", last_id)
+            response = query.order("id").limit(page_size).execute()
+            if not response.data:
+                return
+            yield from response.data
+            last_id = response.data[-1]["id"]
+
+    def iter_votes(self, poll_id, page_size=VOTES_PAGE_SIZE, columns="user, option, created_at"):
+        """
+        Yield every Votes row for a poll in ID order. Votes is the per-option storage that
+        Ballots replaced; read votes through iter_poll_votes, which covers both.
+        """
+        return self._iter_table("Votes", columns, poll_id, page_size)
+
+    def iter_ballots(self, poll_id, page_size=VOTES_PAGE_SIZE):
+        """Yield every Ballots row (user, options, created_at) for a poll in ID order"""
+        return self._iter_table("Ballots", "user, options, created_at", poll_id, page_size)
+
+    def iter_poll_votes(self, poll_id, page_size=VOTES_PAGE_SIZE):
+        """
+        Yield a poll's votes as {"user", "option", "created_at"} rows, one per approved option.
+        Reads Ballots, then the Votes rows of voters who have no ballot there yet (the
+        dual-read period after migration 0004: workers on the previous version may still
+        write Votes until they are restarted).
+        """
+        voters = set()
+        for ballot in self.iter_ballots(poll_id, page_size):
+            voters.add(ballot["user"])
+            for option in ballot["options"]:
+                yield {"user": ballot["user"], "option": option, "created_at": ballot["created_at"]}
+        for vote in self.iter_votes(poll_id, page_size):
+            if vote["user"] not in voters:
+                yield vote
 
     def get_votes_by_candidate(self, poll_id, candidate_ids=None):
         if candidate_ids is None:
             response = self.client.table("PollOptions").select("id").eq("poll", poll_id).execute()
             candidate_ids = [int(item["id"]) for item in response.data]
         
-        candidates = {cid: set() for cid in candidate_ids}
-        for candidate_id in candidate_ids:
-            response = self.client.table("Votes").select("user", "option").eq("poll", poll_id).eq("option", candidate_id).execute()
-            for vote in response.data:
-                candidates[vote["option"]].add(vote["user"])
-        return candidates
+        voter_index = VoterIndex()
+        candidate_rows = {cid: [] for cid in candidate_ids}
+        for vote in self.iter_poll_votes(poll_id):
+            if vote["option"] in candidate_rows:
+                candidate_rows[vote["option"]].append(voter_index.row(vote["user"]))
+        return {cid: voter_index.from_rows(rows) for cid, rows in candidate_rows.items()}
 
     def get_votes_by_candidate_sets(self, poll_id):
         """
@@ -70,12 +250,9 @@ class PollDatabase:
         - keys are frozensets of candidate IDs
         - values are the count of voters who cast that exact ballot
         """
-        # Get all votes for this poll
-        response = self.client.table("Votes").select("user", "option").eq("poll", poll_id).execute()
-        
         # Group votes by user to get each user's ballot
         user_ballots = {}
-        for vote in response.data:
+        for vote in self.iter_poll_votes(poll_id):
             user = vote["user"]
             option = vote["option"]
             if user not in user_ballots:
@@ -92,29 +269,51 @@ class PollDatabase:
         
         return ballot_counts
 
+    def get_poll_snapshot(self, poll_id):
+        """Load a poll's options and stream its votes, independent of the number of options"""
+        options_response = self.client.table("PollOptions").select("id, option, winner, vote_tally").eq("poll", poll_id).execute()
+        return PollSnapshot(poll_id, options_response.data, self.iter_poll_votes(poll_id))
+
+    def get_poll_ballots(self, poll_id):
+        """
+        Load a poll's options and its distinct ballots with their voter counts, for tallying.
+        The ballots are grouped by the poll_ballots database function, so one row per distinct
+        ballot is transferred instead of every vote. Voters are anonymous (see
+        PollSnapshot.from_ballots); use get_poll_snapshot when individual votes are needed.
+        """
+        rows = self.get_poll_ballot_rows(poll_id)
+        return PollSnapshot.from_ballots(poll_id, rows["options"], rows["ballots"])
+
+    def get_poll_ballot_rows(self, poll_id):
+        """The rows get_poll_ballots builds its snapshot from, as {"options": [...], "ballots": [...]}"""
+        options_response = self.client.table("PollOptions").select("id, option, winner, vote_tally").eq("poll", poll_id).execute()
+        ballots_response = self.client.rpc("poll_ballots", {"p_poll": int(poll_id)}).execute()
+        return {"options": options_response.data, "ballots": ballots_response.data}
+
     def get_candidate_text(self, poll_id):
         response = self.client.table("PollOptions").select("id", "option").eq("poll", poll_id).execute()
         candidate_text = {item["id"]: item["option"] for item in response.data}
         return dict(sorted(candidate_text.items()))
 
-    def save_poll_results(self, poll_id, winning_set, candidate_text, vote_tally):
-        losing_set = set(candidate_text.keys()) - winning_set
-        for c in winning_set:
-            self.client.table("PollOptions").upsert({
-                "id": c,
-                "option": candidate_text[c],
-                "poll": poll_id,
-                "winner": True,
-                "vote_tally": vote_tally[c]
-            }).execute()
-        for c in losing_set:
-            self.client.table("PollOptions").upsert({
-                "id": c,
-                "option": candidate_text[c],
-                "poll": poll_id,
-                "winner": False,
-                "vote_tally": vote_tally[c]
-            }).execute()
+    def save_poll_results(self, poll_id, winning_set, candidate_text, vote_tally, stored_results=None):
+        """
+        Save winner flags and tallies for every option in one bulk upsert.
+        If stored_results (option ID -> (winner, vote_tally), see PollSnapshot) already
+        matches, nothing is written. Returns True if the results were written.
+        """
+        rows = [{
+            "id": c,
+            "option": candidate_text[c],
+            "poll": poll_id,
+            "winner": c in winning_set,
+            "vote_tally": vote_tally[c]
+        } for c in candidate_text]
+        if stored_results is not None and all(
+            stored_results.get(row["id"]) == (row["winner"], row["vote_tally"]) for row in rows
+        ):
+            return False
+        self.client.table("PollOptions").upsert(rows).execute()
+        return True
 
     def create_poll(self, title, description, cover_url, seats, email_verification):
         response = self.client.table("Polls").insert({
@@ -133,36 +332,52 @@ class PollDatabase:
         }).execute()
 
     def add_poll_options(self, poll_id, options):
-        for option in options:
-            self.client.table("PollOptions").insert({
-                "option": option,
-                "poll": poll_id
-            }).execute()
+        return self.client.table("PollOptions").insert([
+            {"option": option, "poll": poll_id} for option in options
+        ]).execute()
+
+    def create_poll_with_options(self, user_id, title, description, cover_url, seats, email_verification, options):
+        """Create a poll, its admin link and all its options in one transaction. Returns the poll ID"""
+        response = self.client.rpc("create_poll_with_options", {
+            "p_user": user_id,
+            "p_title": title,
+            "p_description": description,
+            "p_cover_photo": cover_url,
+            "p_seats": seats,
+            "p_email_verification": email_verification,
+            "p_options": list(options)
+        }).execute()
+        return response.data
 
     def is_poll_admin(self, poll_id, user_id):
         """Check if a user is an admin of a specific poll"""
         response = self.client.table("PollAdmins").select("id").eq("poll", poll_id).eq("user", user_id).execute()
         return len(response.data) > 0
 
+    def delete_polls(self, poll_ids, user_id):
+        """
+        Delete the given polls that the user administers, with all their related data, in
+        one transaction (the delete_polls database function). Returns {"deleted": [...],
+        "missing": [...]}: the poll IDs deleted, and those that don't exist. Polls the
+        user doesn't administer are in neither list and are left alone.
+        """
+        response = self.client.rpc("delete_polls", {
+            "p_user": user_id,
+            "p_polls": [int(poll_id) for poll_id in poll_ids]
+        }).execute()
+        for poll_id in response.data["deleted"]:
+            self.forget_poll(poll_id)
+            if self.results_cache is not None:
+                self.results_cache.discard(poll_id)
+        return response.data
+
     def delete_poll(self, poll_id, user_id):
         """Delete a poll and all its related data if the user is authorized"""
-        # Check if user is admin of this poll
-        if not self.is_poll_admin(poll_id, user_id):
+        result = self.delete_polls([poll_id], user_id)
+        if int(poll_id) in result["missing"]:
+            raise ValueError("Poll not found")
+        if int(poll_id) not in result["deleted"]:
             raise ValueError("User is not authorized to delete this poll")
-        
-        # Delete in order to maintain referential integrity
-        # Delete votes first
-        self.client.table("Votes").delete().eq("poll", poll_id).execute()
-        
-        # Delete poll options
-        self.client.table("PollOptions").delete().eq("poll", poll_id).execute()
-        
-        # Delete poll admin relationships
-        self.client.table("PollAdmins").delete().eq("poll", poll_id).execute()
-        
-        # Finally delete the poll itself
-        self.client.table("Polls").delete().eq("id", poll_id).execute()
-        
         return True
 
     def poll_exists(self, poll_id):
@@ -171,43 +386,33 @@ class PollDatabase:
         return len(response.data) > 0
 
     def delete_user(self, email):
-        """Delete a user and all their associated data"""
-        # First check if user exists
-        user_id = self.get_user_id(email)
-        if not user_id:
+        """Delete a user and all their associated data in one transaction (the delete_user database function)"""
+        response = self.client.rpc("delete_user", {"p_email": email}).execute()
+        if response.data is None:
             raise ValueError("User not found")
+        self.user_ids.pop(email)
         
-        # Delete in order to maintain referential integrity
-        # Delete votes first
-        self.client.table("Votes").delete().eq("user", user_id).execute()
-        
-        # Delete poll admin relationships
-        self.client.table("PollAdmins").delete().eq("user", user_id).execute()
-        
-        # Delete form data associated with this email
-        self.client.table("FormData").delete().eq("email", email).execute()
-        
-        # Finally delete the user
-        self.client.table("Users").delete().eq("id", user_id).execute()
-        
+        # Their votes may have been in any poll
+        if self.results_cache is not None:
+            self.results_cache.bump_all()
         return True
 
-    def get_user_polls(self, user_id):
-        """Get all polls owned by a user"""
-        response = self.client.table("PollAdmins").select("poll").eq("user", user_id).execute()
-        poll_ids = [item["poll"] for item in response.data]
-        
-        if not poll_ids:
-            return []
-        
-        polls_response = self.client.table("Polls").select("id, title, description, created_at").in_("id", poll_ids).execute()
-        return polls_response.data
+    def get_user_polls(self, user_id, before=None, limit=DASHBOARD_PAGE_SIZE, poll_id=None):
+        """
+        Up to limit polls owned by a user, newest first, each with its voters, last_vote_at,
+        leader and leader_votes. Pass the last poll's ID as before to get the next page,
+        or a poll_id to get just that poll.
+        """
+        response = self.client.rpc("dashboard_polls", {
+            "p_user": user_id,
+            "p_before": before,
+            "p_limit": limit,
+            "p_poll": poll_id,
+        }).execute()
+        return response.data or []
 
     def get_votes_for_csv(self, poll_id):
         """Get all votes for a poll with timestamps for CSV export"""
-        # Get all votes with timestamps
-        votes_response = self.client.table("Votes").select("user, option, created_at").eq("poll", poll_id).execute()
-        
         # Get all poll options
         options_response = self.client.table("PollOptions").select("id, option").eq("poll", poll_id).execute()
         
@@ -216,7 +421,7 @@ class PollDatabase:
         
         # Group votes by user only (since each user's vote should be one row)
         user_votes = {}
-        for vote in votes_response.data:
+        for vote in self.iter_poll_votes(poll_id):
             user_id = vote["user"]
             timestamp = vote["created_at"]
             option_id = vote["option"]
@@ -0,0 +1,56 @@
+-- Tables the app reads and writes, as they exist in production.
+-- Everything is "if not exists", so this is a no-op on existing databases and brings up
+-- a new database (or a local Postgres for testing) with the same schema.
+
+create table if not exists "Users" (
+  id bigint generated by default as identity primary key,
+  created_at timestamptz not null default now(),
+  -- Null for anonymous voters on polls without email verification
+  email text,
+  full_name text,
+  preferred_name text
+);
+
+create table if not exists "Polls" (
+  id bigint generated by default as identity primary key,
+  created_at timestamptz not null default now(),
+  title text,
+  description text,
+  cover_photo text,
+  seats integer not null default 1,
+  email_verification boolean not null default false
+);
+
+create table if not exists "PollOptions" (
+  id bigint generated by default as identity primary key,
+  created_at timestamptz not null default now(),
+  poll bigint not null references "Polls" (id) on delete cascade,
+  option text not null,
+  -- Results as last saved by PollDatabase.save_poll_results
+  winner boolean,
+  vote_tally integer
+);
+
+create table if not exists "PollAdmins" (
+  id bigint generated by default as identity primary key,
+  created_at timestamptz not null default now(),
+  poll bigint not null references "Polls" (id) on delete cascade,
+  "user" bigint not null references "Users" (id) on delete cascade
+);
+
+-- One row per (user, option) approved; replaced by "Ballots" in 0004
+create table if not exists "Votes" (
+  id bigint generated by default as identity primary key,
+  created_at timestamptz not null default now(),
+  poll bigint not null references "Polls" (id) on delete cascade,
+  option bigint not null references "PollOptions" (id) on delete cascade,
+  "user" bigint not null references "Users" (id) on delete cascade
+);
+
+-- Form submissions kept while their sender verifies their email address
+create table if not exists "FormData" (
+  id bigint generated by default as identity primary key,
+  created_at timestamptz not null default now(),
+  email text not null,
+  form_data jsonb not null
+);
@@ -0,0 +1,53 @@
+-- Atomic ballot replacement and single round trip vote submission.
+
+-- Replace a voter's ballot for a poll. Runs as one statement, so a failed
+-- insert rolls back the delete and tallies never see a half-written ballot.
+create or replace function replace_ballot(p_poll bigint, p_user bigint, p_options bigint[])
+returns void
+language sql
+as $$
+  delete from "Votes" where poll = p_poll and "user" = p_user;
+  insert into "Votes" (poll, option, "user")
+  select p_poll, po.id, p_user
+  from "PollOptions" po
+  where po.poll = p_poll and po.id = any(p_options);
+$$;
+
+-- Resolve the voter and save their ballot.
+-- Returns {"status": ..., "user_id": ...} where status is one of:
+--   saved                  ballot replaced for user_id
+--   email_required         poll requires email verification but no email was given
+--   unknown_user           email has no account yet
+--   verification_required  poll requires email verification and the caller has not verified user_id
+create or replace function submit_ballot(p_poll bigint, p_email text, p_options bigint[], p_verified boolean default false)
+returns json
+language plpgsql
+as $$
+declare
+  v_email_verification boolean;
+  v_user bigint;
+begin
+  select email_verification into v_email_verification from "Polls" where id = p_poll;
+  if not found then
+    raise exception 'Poll % not found', p_poll;
+  end if;
+
+  if coalesce(p_email, '') = '' then
+    if v_email_verification then
+      return json_build_object('status', 'email_required', 'user_id', null);
+    end if;
+    insert into "Users" default values returning id into v_user;
+  else
+    select id into v_user from "Users" where email = p_email limit 1;
+    if v_user is null then
+      return json_build_object('status', 'unknown_user', 'user_id', null);
+    end if;
+    if v_email_verification and not p_verified then
+      return json_build_object('status', 'verification_required', 'user_id', v_user);
+    end if;
+  end if;
+
+  perform replace_ballot(p_poll, v_user, p_options);
+  return json_build_object('status', 'saved', 'user_id', v_user);
+end;
+$$;
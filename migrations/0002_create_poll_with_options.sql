@@ -0,0 +1,31 @@
+-- Create a poll, its admin link and all of its options in one transaction.
+-- Returns the new poll ID. Options keep the order they were submitted in.
+create or replace function create_poll_with_options(
+  p_user bigint,
+  p_title text,
+  p_description text,
+  p_cover_photo text,
+  p_seats integer,
+  p_email_verification boolean,
+  p_options text[]
+)
+returns bigint
+language plpgsql
+as $$
+declare
+  v_poll bigint;
+begin
+  insert into "Polls" (title, description, cover_photo, seats, email_verification)
+  values (p_title, p_description, p_cover_photo, p_seats, p_email_verification)
+  returning id into v_poll;
+
+  insert into "PollAdmins" (poll, "user") values (v_poll, p_user);
+
+  insert into "PollOptions" (option, poll)
+  select o.option_text, v_poll
+  from unnest(p_options) with ordinality as o(option_text, position)
+  order by o.position;
+
+  return v_poll;
+end;
+$$;
@@ -0,0 +1,24 @@
+-- Ballots of a poll grouped in the database, so tallying doesn't need every Votes row.
+
+-- Distinct ballots cast in a poll and how many voters cast each one, as
+-- [{"options": [option IDs, ascending], "voters": count}, ...].
+-- Ballots are listed in order of their earliest vote, the order in which reading
+-- Votes by ID first meets them, so tied winners are listed the same way as before.
+create or replace function poll_ballots(p_poll bigint)
+returns json
+language sql
+stable
+as $$
+  with user_ballots as (
+    select array_agg(distinct option order by option) as options, min(id) as first_vote
+    from "Votes"
+    where poll = p_poll
+    group by "user"
+  )
+  select coalesce(json_agg(json_build_object('options', options, 'voters', voters) order by first_vote), '[]'::json)
+  from (
+    select options, count(*) as voters, min(first_vote) as first_vote
+    from user_ballots
+    group by options
+  ) ballots;
+$$;
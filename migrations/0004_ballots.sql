@@ -0,0 +1,69 @@
+-- One row per ballot instead of one row per (user, option).
+-- Ballots holds each voter's approved options as an array. Existing votes are copied
+-- over below; voters who still only have rows in Votes (cast by workers running the
+-- previous version while this is deployed) are read from there until they vote again.
+
+create table if not exists "Ballots" (
+  id bigint generated by default as identity primary key,
+  poll bigint not null references "Polls" (id) on delete cascade,
+  "user" bigint not null references "Users" (id) on delete cascade,
+  -- Approved option IDs, ascending. created_at is when the ballot was last cast.
+  options bigint[] not null,
+  created_at timestamptz not null default now(),
+  unique (poll, "user")
+);
+
+-- Backfill from Votes, oldest ballots first so IDs follow the order votes were cast
+insert into "Ballots" (poll, "user", options, created_at)
+select poll, "user", array_agg(distinct option order by option), coalesce(min(created_at), now())
+from "Votes"
+group by poll, "user"
+order by min(id)
+on conflict (poll, "user") do nothing;
+
+-- Replace a voter's ballot for a poll with a single upsert. Options that aren't in the
+-- poll are dropped. The voter's rows in Votes, if any, are removed so they can't be
+-- read back in place of the new ballot.
+create or replace function replace_ballot(p_poll bigint, p_user bigint, p_options bigint[])
+returns void
+language sql
+as $$
+  insert into "Ballots" (poll, "user", options, created_at)
+  select p_poll, p_user, array(
+    select po.id
+    from "PollOptions" po
+    where po.poll = p_poll and po.id = any(p_options)
+    order by po.id
+  ), now()
+  on conflict (poll, "user") do update
+  set options = excluded.options, created_at = excluded.created_at;
+  delete from "Votes" where poll = p_poll and "user" = p_user;
+$$;
+
+-- Distinct ballots cast in a poll and how many voters cast each one (see 0003), read
+-- from Ballots plus Votes rows of voters who have no row in Ballots yet.
+-- Ballots are listed in the order PollDatabase.iter_poll_votes meets them: Ballots rows by
+-- ID (kept when a voter changes their ballot), then the remaining Votes rows by ID.
+create or replace function poll_ballots(p_poll bigint)
+returns json
+language sql
+stable
+as $$
+  with user_ballots as (
+    select b.options, array[0, b.id] as read_order
+    from "Ballots" b
+    where b.poll = p_poll and cardinality(b.options) > 0
+    union all
+    select array_agg(distinct v.option order by v.option), array[1, min(v.id)]
+    from "Votes" v
+    where v.poll = p_poll
+      and not exists (select 1 from "Ballots" b where b.poll = p_poll and b."user" = v."user")
+    group by v."user"
+  )
+  select coalesce(json_agg(json_build_object('options', options, 'voters', voters) order by read_order), '[]'::json)
+  from (
+    select options, count(*) as voters, min(read_order) as read_order
+    from user_ballots
+    group by options
+  ) ballots;
+$$;
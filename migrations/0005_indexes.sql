@@ -0,0 +1,24 @@
+-- Indexes for the queries the app runs on every request.
+-- The unique indexes fail to build if the table already has duplicates; remove those first.
+
+-- Votes by poll and option, by poll and voter (replace_ballot, the dual read in
+-- poll_ballots), and by voter (delete_user)
+create index if not exists votes_poll_option_idx on "Votes" (poll, option);
+create index if not exists votes_poll_user_idx on "Votes" (poll, "user");
+create index if not exists votes_user_idx on "Votes" ("user");
+
+-- Ballots by poll and voter are covered by their unique constraint; this is for delete_user
+create index if not exists ballots_user_idx on "Ballots" ("user");
+
+-- A poll's options (poll page, results, CSV)
+create index if not exists poll_options_poll_idx on "PollOptions" (poll);
+
+-- is_poll_admin looks up (poll, user); get_user_polls and delete_user look up user
+create unique index if not exists poll_admins_poll_user_key on "PollAdmins" (poll, "user");
+create index if not exists poll_admins_user_idx on "PollAdmins" ("user");
+
+-- Users are looked up by email on every vote, login and poll submission
+create unique index if not exists users_email_key on "Users" (email);
+
+-- Saved form data by email (save_form_data, get_form_data, delete_user)
+create index if not exists form_data_email_idx on "FormData" (email);
@@ -0,0 +1,58 @@
+-- Delete polls and users together with everything that refers to them, each in one
+-- transaction, so a failure part way can't leave orphaned ballots or votes behind.
+
+-- Delete the polls in p_polls that p_user administers, with their ballots, votes,
+-- options and admin links. Returns {"deleted": [poll IDs], "missing": [poll IDs]}, where
+-- missing are the requested polls that don't exist. Requested polls that exist but that
+-- p_user doesn't administer are left alone.
+create or replace function delete_polls(p_user bigint, p_polls bigint[])
+returns json
+language plpgsql
+as $$
+declare
+  v_deleted bigint[];
+  v_missing bigint[];
+begin
+  select coalesce(array_agg(distinct p.id order by p.id), '{}') into v_deleted
+  from "Polls" p
+  join "PollAdmins" pa on pa.poll = p.id and pa."user" = p_user
+  where p.id = any(p_polls);
+
+  select coalesce(array_agg(distinct requested.poll order by requested.poll), '{}') into v_missing
+  from unnest(p_polls) as requested(poll)
+  where not exists (select 1 from "Polls" p where p.id = requested.poll);
+
+  delete from "Ballots" where poll = any(v_deleted);
+  delete from "Votes" where poll = any(v_deleted);
+  delete from "PollOptions" where poll = any(v_deleted);
+  delete from "PollAdmins" where poll = any(v_deleted);
+  delete from "Polls" where id = any(v_deleted);
+
+  return json_build_object('deleted', v_deleted, 'missing', v_missing);
+end;
+$$;
+
+-- Delete the user with this email, with their ballots, votes, admin links and saved
+-- form data. Polls they administer are kept. Returns the user's ID, or null if there
+-- is no such user.
+create or replace function delete_user(p_email text)
+returns bigint
+language plpgsql
+as $$
+declare
+  v_user bigint;
+begin
+  select id into v_user from "Users" where email = p_email limit 1;
+  if v_user is null then
+    return null;
+  end if;
+
+  delete from "Ballots" where "user" = v_user;
+  delete from "Votes" where "user" = v_user;
+  delete from "PollAdmins" where "user" = v_user;
+  delete from "FormData" where email = p_email;
+  delete from "Users" where id = v_user;
+
+  return v_user;
+end;
+$$;
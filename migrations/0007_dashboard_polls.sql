@@ -0,0 +1,69 @@
+-- The dashboard's polls with their activity, one page per call.
+
+-- Each voter's ballot in a poll: rows of Ballots, plus Votes grouped by voter for
+-- voters who have no row in Ballots yet (see 0004). Empty ballots are left out.
+create or replace function poll_user_ballots(p_poll bigint)
+returns table (options bigint[], created_at timestamptz)
+language sql
+stable
+as $$
+  select b.options, b.created_at
+  from "Ballots" b
+  where b.poll = p_poll and cardinality(b.options) > 0
+  union all
+  select array_agg(distinct v.option order by v.option), min(v.created_at)
+  from "Votes" v
+  where v.poll = p_poll
+    and not exists (select 1 from "Ballots" b where b.poll = p_poll and b."user" = v."user")
+  group by v."user";
+$$;
+
+-- A user's polls in ID order, for paging through them from the newest
+create index if not exists poll_admins_user_poll_idx on "PollAdmins" ("user", poll);
+
+-- Polls p_user administers, newest first, at most p_limit of them, as
+-- [{"id", "title", "description", "created_at", "voters", "last_vote_at", "leader", "leader_votes"}].
+-- leader is the text of the option with the most approvals (the lowest option ID among
+-- equals), null with no votes. For the next page pass the last poll's ID as p_before.
+-- p_poll restricts the result to that one poll.
+create or replace function dashboard_polls(p_user bigint, p_before bigint default null, p_limit integer default 50, p_poll bigint default null)
+returns json
+language sql
+stable
+as $$
+  select coalesce(json_agg(row_to_json(page) order by page.id desc), '[]'::json)
+  from (
+    select p.id, p.title, p.description, p.created_at,
+           stats.voters, stats.last_vote_at, stats.leader, stats.leader_votes
+    -- The page of polls is picked first, so the statistics are only worked out for it
+    from (
+      select pa.poll
+      from "PollAdmins" pa
+      where pa."user" = p_user
+        and (p_before is null or pa.poll < p_before)
+        and (p_poll is null or pa.poll = p_poll)
+      order by pa.poll desc
+      limit p_limit
+    ) as owned
+    join "Polls" p on p.id = owned.poll
+    cross join lateral (
+      with ballots as (
+        select * from poll_user_ballots(p.id)
+      )
+      select (select count(*) from ballots) as voters,
+             (select max(ballots.created_at) from ballots) as last_vote_at,
+             top.option as leader,
+             top.votes as leader_votes
+      from (select 1) as one
+      left join (
+        select po.option, count(*) as votes
+        from ballots
+        cross join unnest(ballots.options) as approved(option_id)
+        join "PollOptions" po on po.id = approved.option_id
+        group by po.id, po.option
+        order by count(*) desc, po.id
+        limit 1
+      ) as top on true
+    ) as stats
+  ) page;
+$$;
@@ -0,0 +1,182 @@
+from collections.abc import Mapping, Sequence
+
+# Decimal places kept for fractional vote counts in RoundHistory.to_compact
+COUNT_DIGITS = 6
+
+class RoundHistory(Sequence):
+    """
+    The rounds of the excess vote method, as returned by the tally engines.
+
+    Stores the starting ballot counts and candidate -> voters map once, plus what each
+    step of the tally changed (ballots removed, ballots whose weight changed or that were
+    created by redistribution, and winners removed from the candidates), instead of a
+    copy of both for every round. history[n] is a RoundView, a read-only mapping with the
+    keys a round always had (ballot_counts, votes_per_candidate, and winner, is_tie,
+    tie_group and winner_tally for winner rounds). Its ballot_counts and
+    votes_per_candidate are rebuilt from the deltas when first read, and the last
+    rebuilt state is kept so reading rounds in order replays each delta once.
+    """
+    def __init__(self, ballot_counts, candidate_counts):
+        self.initial_ballots = dict(ballot_counts)
+        self.initial_candidates = dict(candidate_counts)
+        # changes[k] = (removed ballots, {ballot: new count}, removed candidates) after step k
+        self.changes = []
+        # (step, winner, tie_group, winner_tally) per round; winner is None for the round
+        # recorded when no votes are left
+        self.rounds = []
+        self.last_state = (0, self.initial_ballots, self.initial_candidates)
+
+    def add_rounds(self, winners, winner_tally):
+        """Record one round per winner of the current step (ties give several), or an empty round"""
+        step = len(self.changes)
+        if not winners:
+            self.rounds.append((step, None, None, None))
+        for winner in winners:
+            self.rounds.append((step, winner, list(winners), winner_tally))
+
+    def advance(self, removed_ballots, changed_ballots, removed_candidates):
+        """
+        Record the changes that lead to the next step's state. changed_ballots keeps its
+        order: ballots not in the current state are added in that order, after the rest.
+        """
+        self.changes.append((list(removed_ballots), dict(changed_ballots), list(removed_candidates)))
+
+    def state(self, step):
+        """(ballot_counts, votes_per_candidate) at the start of a step; treat as read-only"""
+        last_step, ballots, candidates = self.last_state
+        if last_step > step:
+            last_step, ballots, candidates = 0, self.initial_ballots, self.initial_candidates
+        for removed_ballots, changed_ballots, removed_candidates in self.changes[last_step:step]:
+            ballots = dict(ballots)
+            for ballot in removed_ballots:
+                del ballots[ballot]
+            ballots.update(changed_ballots)
+            candidates = dict(candidates)
+            for candidate in removed_candidates:
+                candidates.pop(candidate, None)
+        self.last_state = (step, ballots, candidates)
+        return ballots, candidates
+
+    def to_compact(self, candidate_ids, approvals):
+        """
+        JSON-ready form of the history for the results page animation. Candidates are
+        referred to by their index in "candidates", ballots by their index in "ballots"
+        (sorted lists of candidate indexes), and counts are rounded to COUNT_DIGITS
+        decimal places. "initial" holds the starting [ballot, count] pairs, "steps"
+        each step's removed ballots and changed [ballot, count] pairs, and "rounds" each
+        round's step and, for winner rounds, its winner, tie_group and tally.
+        approvals maps candidate IDs to how many voters approved them.
+        """
+        candidates = list(candidate_ids)
+        column = {candidate: i for i, candidate in enumerate(candidates)}
+        ballots = []
+        ballot_index = {}
+
+        def candidate(c):
+            if c not in column:
+                column[c] = len(candidates)
+                candidates.append(c)
+            return column[c]
+
+        def ballot(b):
+            if b not in ballot_index:
+                ballot_index[b] = len(ballots)
+                ballots.append(sorted(candidate(c) for c in b))
+            return ballot_index[b]
+
+        def count(c):
+            return c if isinstance(c, int) else round(float(c), COUNT_DIGITS)
+
+        initial = [[ballot(b), count(c)] for b, c in self.initial_ballots.items()]
+        steps = [{"removed": [ballot(b) for b in removed],
+                  "changed": [[ballot(b), count(c)] for b, c in changed.items()]}
+                 for removed, changed, _ in self.changes]
+        rounds = []
+        for step, winner, tie_group, winner_tally in self.rounds:
+            round_data = {"step": step}
+            if winner is not None:
+                round_data.update(winner=candidate(winner), tie_group=[candidate(c) for c in tie_group],
+                                  tally=count(winner_tally))
+            rounds.append(round_data)
+        return {
+            "candidates": candidates,
+            "approvals": [approvals.get(c, 0) for c in candidates],
+            "ballots": ballots,
+            "initial": initial,
+            "steps": steps,
+            "rounds": rounds
+        }
+
+    def __len__(self):
+        return len(self.rounds)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [RoundView(self, i) for i in range(*index.indices(len(self.rounds)))]
+        if index < 0:
+            index += len(self.rounds)
+        if not 0 <= index < len(self.rounds):
+            raise IndexError("round index out of range")
+        return RoundView(self, index)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["last_state"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.last_state = (0, self.initial_ballots, self.initial_candidates)
+
+    def __repr__(self):
+        return f"RoundHistory({list(map(dict, self))!r})"
+
+class RoundView(Mapping):
+    """One round of a RoundHistory, read like the round dicts the engines used to return"""
+    __slots__ = ("history", "index")
+
+    def __init__(self, history, index):
+        self.history = history
+        self.index = index
+
+    def keys_present(self):
+        winner = self.history.rounds[self.index][1]
+        if winner is None:
+            return ("ballot_counts", "votes_per_candidate")
+        return ("ballot_counts", "votes_per_candidate", "winner", "is_tie", "tie_group", "winner_tally")
+
+    def __getitem__(self, key):
+        step, winner, tie_group, winner_tally = self.history.rounds[self.index]
+        if key == "ballot_counts":
+            return self.history.state(step)[0]
+        if key == "votes_per_candidate":
+            return self.history.state(step)[1]
+        if winner is not None:
+            if key == "winner":
+                return winner
+            if key == "is_tie":
+                return True
+            if key == "tie_group":
+                return tie_group
+            if key == "winner_tally":
+                return winner_tally
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.keys_present()
+
+    def __iter__(self):
+        return iter(self.keys_present())
+
+    def __len__(self):
+        return len(self.keys_present())
+
+    def __repr__(self):
+        return f"RoundView({dict(self)!r})"
@@ -0,0 +1,241 @@
+import os
+import threading
+import time
+import pytest
+from cache import LRUCache, ResultsCache, SharedVersions, SingleFlight, fcntl, private_dir
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class Counter:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.calls
+
+def wait_for_refresh(cache, poll_id):
+    deadline = time.time() + 5
+    while poll_id in cache.refreshing and time.time() < deadline:
+        time.sleep(0.01)
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" is now most recently used
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+def test_lru_cache_expires_entries_after_ttl(clock):
+    cache = LRUCache(maxsize=2, ttl=60, clock=clock)
+    cache.set("a", 1)
+    clock.now += 59
+    assert cache.get("a") == 1
+    clock.now += 1
+    assert cache.get("a") is None
+    assert "a" not in cache
+    cache.set("a", 2)
+    assert cache.pop("a") == 2
+
+def test_results_cache_serves_fresh_entry(clock):
+    cache = ResultsCache(ttl=30, stale_budget=5, clock=clock)
+    compute = Counter()
+    assert cache.get_or_compute(1, compute) == 1
+    clock.now += 10
+    assert cache.get_or_compute(1, compute) == 1
+    assert compute.calls == 1
+
+def test_results_cache_recomputes_right_after_bump(clock):
+    cache = ResultsCache(ttl=30, stale_budget=5, clock=clock)
+    compute = Counter()
+    cache.get_or_compute(1, compute)
+
+    cache.bump(1)
+    # A vote is never hidden behind the staleness budget
+    assert cache.get_or_compute(1, compute) == 2
+    assert cache.refreshing == set()
+
+def test_results_cache_stale_while_revalidate_after_ttl(clock):
+    cache = ResultsCache(ttl=30, stale_budget=5, clock=clock)
+    compute = Counter()
+    cache.get_or_compute(1, compute)
+
+    clock.now += 32
+    # Within the staleness budget the old value is served and refreshed in the background
+    assert cache.get_or_compute(1, compute) == 1
+    wait_for_refresh(cache, 1)
+    assert compute.calls == 2
+    assert cache.get_or_compute(1, compute) == 2
+
+def test_results_cache_recomputes_past_stale_budget(clock):
+    cache = ResultsCache(ttl=30, stale_budget=5, clock=clock)
+    compute = Counter()
+    cache.get_or_compute(1, compute)
+
+    clock.now += 36
+    assert cache.get_or_compute(1, compute) == 2
+
+def test_results_cache_ttl_expiry(clock):
+    cache = ResultsCache(ttl=30, stale_budget=0, clock=clock)
+    compute = Counter()
+    cache.get_or_compute(1, compute)
+    clock.now += 31
+    assert cache.get_or_compute(1, compute) == 2
+
+def test_results_cache_bump_only_affects_one_poll(clock):
+    cache = ResultsCache(ttl=30, stale_budget=0, clock=clock)
+    first, second = Counter(), Counter()
+    cache.get_or_compute(1, first)
+    cache.get_or_compute(2, second)
+    clock.now += 1
+    cache.bump(1)
+    assert cache.get_or_compute(1, first) == 2
+    assert cache.get_or_compute(2, second) == 1
+
+def test_results_cache_bump_all(clock):
+    cache = ResultsCache(ttl=30, stale_budget=0, clock=clock)
+    first, second = Counter(), Counter()
+    cache.get_or_compute(1, first)
+    cache.get_or_compute(2, second)
+    clock.now += 1
+    cache.bump_all()
+    assert cache.get_or_compute(1, first) == 2
+    assert cache.get_or_compute(2, second) == 2
+
+def test_results_cache_discard(clock):
+    cache = ResultsCache(ttl=30, stale_budget=5, clock=clock)
+    compute = Counter()
+    cache.get_or_compute(1, compute)
+    cache.discard(1)
+    # Never served stale after a discard
+    assert cache.get_or_compute(1, compute) == 2
+
+def test_results_cache_sees_bumps_from_other_processes(clock, tmp_path):
+    # Two workers' caches sharing the version directory
+    first = ResultsCache(ttl=30, stale_budget=5, clock=clock, versions=SharedVersions(str(tmp_path)))
+    second = ResultsCache(ttl=30, stale_budget=5, clock=clock, versions=SharedVersions(str(tmp_path)))
+    first_compute, second_compute = Counter(), Counter()
+    first.get_or_compute(1, first_compute)
+    second.get_or_compute(1, second_compute)
+    second.get_or_compute(2, second_compute)
+
+    first.bump(1)
+    assert second.get_or_compute(1, second_compute) == 3
+    assert second.get_or_compute(2, second_compute) == 2
+    first.bump_all()
+    assert second.get_or_compute(2, second_compute) == 4
+
+def test_shared_versions_change_on_every_bump(tmp_path):
+    versions = SharedVersions(private_dir(str(tmp_path / "versions")))
+    assert versions.get("poll-1") is None
+    versions.bump("poll-1")
+    first = versions.get("poll-1")
+    versions.bump("poll-1")
+    assert versions.get("poll-1") not in (None, first)
+    assert versions.get("poll-2") is None
+
+def test_single_flight_shares_one_computation():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(single_flight.do("poll-1", slow)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(single_flight.do("poll-1", slow))) for _ in range(4)]
+    for follower in followers:
+        follower.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == ["result"] * 5
+    # Once finished, the next call computes again
+    release.set()
+    single_flight.do("poll-1", slow)
+    assert len(calls) == 2
+
+def test_single_flight_shares_errors():
+    single_flight = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        single_flight.do("poll-1", fail)
+
+def publish_while_waiting(lock_dir, version, waiter_version):
+    """Another process holds the lock for poll-1 at version and publishes while we wait at waiter_version"""
+    single_flight = SingleFlight(lock_dir=lock_dir)
+    other_process = SingleFlight(lock_dir=lock_dir)
+    entered = threading.Event()
+
+    def publish_after_delay():
+        entered.set()
+        time.sleep(0.1)
+        return {"rows": ["from other process"]}
+
+    other = threading.Thread(target=lambda: other_process.do("x", publish_after_delay, shared_key="poll-1", shared_version=version))
+    other.start()
+    entered.wait(5)
+    result = single_flight.do(("poll", 1), lambda: {"rows": ["recomputed"]}, shared_key="poll-1", shared_version=waiter_version)
+    other.join(5)
+    return result
+
+@pytest.mark.skipif(fcntl is None, reason="lock files need fcntl")
+def test_single_flight_reuses_result_published_while_waiting(tmp_path):
+    single_flight = SingleFlight(lock_dir=str(tmp_path))
+    assert single_flight.do(("poll", 1), lambda: "first", shared_key="poll-1", shared_version=[0, 1]) == "first"
+    # A result published before this call started waiting is not reused
+    assert single_flight.do(("poll", 1), lambda: "second", shared_key="poll-1", shared_version=[0, 1]) == "second"
+
+    assert publish_while_waiting(str(tmp_path), [0, 1], [0, 1]) == {"rows": ["from other process"]}
+
+@pytest.mark.skipif(fcntl is None, reason="lock files need fcntl")
+def test_single_flight_ignores_result_published_for_an_older_version(tmp_path):
+    # The other process started before a vote bumped the version we are waiting with
+    assert publish_while_waiting(str(tmp_path), [0, 1], [0, 2]) == {"rows": ["recomputed"]}
+
+@pytest.mark.skipif(fcntl is None, reason="lock files need fcntl")
+def test_single_flight_keeps_a_bounded_number_of_files(tmp_path):
+    single_flight = SingleFlight(lock_dir=str(tmp_path), stripes=4)
+    for poll_id in range(50):
+        single_flight.do(poll_id, lambda: poll_id, shared_key=f"poll-{poll_id}", shared_version=[0, 0])
+    assert len(os.listdir(tmp_path)) <= 8
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="needs POSIX permissions")
+def test_private_dir(tmp_path):
+    path = str(tmp_path / "results")
+    assert private_dir(path) == path
+    assert private_dir(path) == path
+    os.chmod(path, 0o777)
+    with pytest.raises(PermissionError):
+        private_dir(path)
+    os.chmod(path, 0o700)
+    with open(tmp_path / "file", "w"):
+        pass
+    with pytest.raises(PermissionError):
+        private_dir(str(tmp_path / "file"))
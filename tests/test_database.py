@@ -1,6 +1,7 @@
 import pytest
 from unittest.mock import Mock, patch
 from database import PollDatabase
+from constants import DASHBOARD_PAGE_SIZE
 
 @pytest.fixture
 def mock_supabase():
@@ -10,6 +11,16 @@ def mock_supabase():
 def db(mock_supabase):
     return PollDatabase(mock_supabase)
 
+def separate_tables(mock_supabase, ballots=()):
+    """Give each table its own mock, so that Votes, Ballots and PollOptions can return different rows"""
+    tables = {}
+    mock_supabase.table.side_effect = lambda name=None: tables.setdefault(name, Mock())
+    mock_supabase.table("Ballots").select().eq().order().limit().execute.return_value.data = list(ballots)
+    # Each table's rows come back as one page, followed by an empty one
+    mock_supabase.table("Ballots").select().eq().gt().order().limit().execute.return_value.data = []
+    mock_supabase.table("Votes").select().eq().gt().order().limit().execute.return_value.data = []
+    return tables
+
 def test_get_user_id_exists(db, mock_supabase):
     mock_supabase.table().select().eq().execute.return_value.data = [{'id': 123}]
     assert db.get_user_id('test@example.com') == 123
@@ -18,6 +29,27 @@ def test_get_user_id_not_exists(db, mock_supabase):
     mock_supabase.table().select().eq().execute.return_value.data = []
     assert db.get_user_id('test@example.com') is None
 
+def test_get_user_id_is_cached(db, mock_supabase):
+    mock_supabase.table().select().eq().execute.return_value.data = [{'id': 123}]
+    mock_supabase.table().select().eq().execute.reset_mock()
+    assert db.get_user_id('test@example.com') == 123
+    assert db.get_user_id('test@example.com') == 123
+    assert db.user_exists('test@example.com') is True
+    assert mock_supabase.table().select().eq().execute.call_count == 1
+
+def test_get_user_id_does_not_cache_unknown_emails(db, mock_supabase):
+    mock_supabase.table().select().eq().execute.return_value.data = []
+    assert db.get_user_id('test@example.com') is None
+    mock_supabase.table().select().eq().execute.return_value.data = [{'id': 123}]
+    assert db.get_user_id('test@example.com') == 123
+
+def test_create_user_caches_user_id(db, mock_supabase):
+    mock_supabase.table().insert().execute.return_value.data = [{'id': 456}]
+    assert db.create_user('new@example.com', 'New User', 'New') == 456
+    mock_supabase.table().select().eq().execute.reset_mock()
+    assert db.get_user_id('new@example.com') == 456
+    mock_supabase.table().select().eq().execute.assert_not_called()
+
 def test_user_exists(db, mock_supabase):
     mock_supabase.table().select().eq().execute.return_value.data = [{'id': 123}]
     assert db.user_exists('test@example.com') is True
@@ -38,21 +70,70 @@ def test_get_poll_details(db, mock_supabase):
     result = db.get_poll_details(1)
     assert result == mock_data
 
+def test_poll_definitions_are_cached(db, mock_supabase):
+    mock_supabase.table().select().eq().execute.return_value.data = [{'seats': 2, 'title': 'Test', 'email_verification': True}]
+    mock_supabase.table().select().eq().execute.reset_mock()
+    assert db.get_poll_details(1)['title'] == 'Test'
+    assert db.get_poll_details("1")['seats'] == 2
+    assert db.get_poll_email_verification(1) is True
+    assert mock_supabase.table().select().eq().execute.call_count == 1
+
+    mock_supabase.table().select().eq().execute.return_value.data = [{'id': 10, 'option': 'A'}]
+    assert db.get_poll_candidates(1) == [(10, 'A')]
+    assert db.get_poll_candidates(1) == [(10, 'A')]
+    assert mock_supabase.table().select().eq().execute.call_count == 2
+
+def test_missing_poll_is_not_cached(db, mock_supabase):
+    mock_supabase.table().select().eq().execute.return_value.data = []
+    assert db.get_poll_details(1) is None
+    mock_supabase.table().select().eq().execute.return_value.data = [{'seats': 1}]
+    assert db.get_poll_details(1) == {'seats': 1}
+
+def test_delete_poll_forgets_cached_definition(db, mock_supabase):
+    mock_supabase.table().select().eq().execute.return_value.data = [{'seats': 2}]
+    db.get_poll_details(1)
+    mock_supabase.rpc().execute.return_value.data = {'deleted': [1], 'missing': []}
+    db.delete_poll(poll_id=1, user_id=123)
+    mock_supabase.table().select().eq().execute.return_value.data = []
+    assert db.get_poll_details(1) is None
+
 def test_save_votes(mock_supabase):
     db = PollDatabase(mock_supabase)
     db.save_votes(1, 123, ["1|Option 1", "2|Option 2"])
     
-    mock_supabase.table().delete().eq().eq().execute.assert_called_once()
-    # Called twice - once for each option
-    assert mock_supabase.table().insert().execute.call_count == 2
+    # Delete and inserts happen in a single atomic call
+    mock_supabase.rpc.assert_called_once_with("replace_ballot", {
+        "p_poll": 1, "p_user": 123, "p_options": [1, 2]
+    })
+    mock_supabase.rpc().execute.assert_called_once()
+    mock_supabase.table.assert_not_called()
+
+def test_submit_ballot(mock_supabase):
+    mock_supabase.rpc().execute.return_value.data = {"status": "saved", "user_id": 123}
+    db = PollDatabase(mock_supabase)
+    result = db.submit_ballot("1", "test@example.com", ["1|Option 1", "3|Option 3"], verified=True)
+
+    assert result == {"status": "saved", "user_id": 123}
+    mock_supabase.rpc.assert_called_with("submit_ballot", {
+        "p_poll": 1, "p_email": "test@example.com", "p_options": [1, 3], "p_verified": True
+    })
+
+def test_submit_ballot_anonymous(mock_supabase):
+    db = PollDatabase(mock_supabase)
+    db.submit_ballot(1, "", ["2|Option 2"])
+
+    mock_supabase.rpc.assert_called_with("submit_ballot", {
+        "p_poll": 1, "p_email": None, "p_options": [2], "p_verified": False
+    })
 
 def test_get_votes_by_candidate(db, mock_supabase):
-    mock_supabase.table().select().eq().execute.return_value.data = [
+    separate_tables(mock_supabase)
+    mock_supabase.table("PollOptions").select().eq().execute.return_value.data = [
         {'id': 1}, {'id': 2}
     ]
-    mock_supabase.table().select().eq().eq().execute.return_value.data = [
-        {'user': 101, 'option': 1},
-        {'user': 102, 'option': 1}
+    mock_supabase.table("Votes").select().eq().order().limit().execute.return_value.data = [
+        {'id': 1, 'user': 101, 'option': 1},
+        {'id': 2, 'user': 102, 'option': 1}
     ]
     result = db.get_votes_by_candidate(1)
     assert len(result[1]) == 2  # Two votes for candidate 1 
@@ -101,44 +182,77 @@ def test_delete_poll_authorized():
     """Test deleting a poll when user is authorized"""
     mock_supabase = Mock()
     # Mock that user is admin
-    mock_supabase.table().select().eq().eq().execute.return_value.data = [{'id': 1}]
+    mock_supabase.rpc().execute.return_value.data = {'deleted': [1], 'missing': []}
     
     db = PollDatabase(mock_supabase)
     result = db.delete_poll(poll_id=1, user_id=123)
     
     assert result is True
-    # Should call delete 4 times (votes, options, admins, poll)
-    assert mock_supabase.table().delete().eq().execute.call_count == 4
+    # Authorization and all deletes happen in one database call
+    mock_supabase.rpc.assert_called_with("delete_polls", {"p_user": 123, "p_polls": [1]})
+    mock_supabase.table().delete().eq().execute.assert_not_called()
 
 def test_delete_poll_unauthorized():
     """Test deleting a poll when user is NOT authorized"""
     mock_supabase = Mock()
     # Mock that user is NOT admin
-    mock_supabase.table().select().eq().eq().execute.return_value.data = []
+    mock_supabase.rpc().execute.return_value.data = {'deleted': [], 'missing': []}
     
     db = PollDatabase(mock_supabase)
     
     with pytest.raises(ValueError, match="User is not authorized to delete this poll"):
         db.delete_poll(poll_id=1, user_id=123)
 
+def test_delete_poll_not_found():
+    """Test deleting a poll that doesn't exist"""
+    mock_supabase = Mock()
+    mock_supabase.rpc().execute.return_value.data = {'deleted': [], 'missing': [1]}
+    
+    db = PollDatabase(mock_supabase)
+    
+    with pytest.raises(ValueError, match="Poll not found"):
+        db.delete_poll(poll_id=1, user_id=123)
+
+def test_delete_polls_in_bulk():
+    """Test deleting several polls in one call, skipping ones the user doesn't administer"""
+    mock_supabase = Mock()
+    mock_supabase.rpc().execute.return_value.data = {'deleted': [1, 3], 'missing': [4]}
+    results_cache = Mock()
+    
+    db = PollDatabase(mock_supabase, results_cache)
+    result = db.delete_polls(["1", 2, 3, 4], user_id=123)
+    
+    assert result == {'deleted': [1, 3], 'missing': [4]}
+    mock_supabase.rpc.assert_called_with("delete_polls", {"p_user": 123, "p_polls": [1, 2, 3, 4]})
+    assert [c.args for c in results_cache.discard.call_args_list] == [(1,), (3,)]
+
 def test_delete_user_success():
     """Test deleting a user when user exists"""
     mock_supabase = Mock()
     # Mock that user exists
-    mock_supabase.table().select().eq().execute.return_value.data = [{'id': 123}]
+    mock_supabase.rpc().execute.return_value.data = 123
     
     db = PollDatabase(mock_supabase)
     result = db.delete_user('test@example.com')
     
     assert result is True
-    # Should call delete 4 times (votes, poll admins, form data, user)
-    assert mock_supabase.table().delete().eq().execute.call_count == 4
+    # The lookup and all deletes happen in one database call
+    mock_supabase.rpc.assert_called_with("delete_user", {"p_email": 'test@example.com'})
+    mock_supabase.table().delete().eq().execute.assert_not_called()
+
+def test_delete_user_forgets_cached_user_id(db, mock_supabase):
+    mock_supabase.table().select().eq().execute.return_value.data = [{'id': 123}]
+    db.get_user_id('test@example.com')
+    mock_supabase.rpc().execute.return_value.data = 123
+    db.delete_user('test@example.com')
+    mock_supabase.table().select().eq().execute.return_value.data = []
+    assert db.get_user_id('test@example.com') is None
 
 def test_delete_user_not_found():
     """Test deleting a user when user does NOT exist"""
     mock_supabase = Mock()
     # Mock that user does NOT exist
-    mock_supabase.table().select().eq().execute.return_value.data = []
+    mock_supabase.rpc().execute.return_value.data = None
     
     db = PollDatabase(mock_supabase)
     
@@ -149,7 +263,7 @@ def test_delete_user_nonexistent():
     """Test deleting a user that doesn't exist"""
     mock_supabase = Mock()
     # Mock that user doesn't exist
-    mock_supabase.table().select().eq().execute.return_value.data = []
+    mock_supabase.rpc().execute.return_value.data = None
     
     db = PollDatabase(mock_supabase)
     
@@ -157,30 +271,44 @@ def test_delete_user_nonexistent():
         db.delete_user('nonexistent@example.com')
 
 def test_get_user_polls_with_polls():
-    """Test getting polls for a user who has polls"""
+    """Test getting polls for a user who has polls, with their activity"""
     mock_supabase = Mock()
-    # Mock PollAdmins response
-    mock_supabase.table().select().eq().execute.return_value.data = [
-        {"poll": 1}, {"poll": 2}
-    ]
-    # Mock Polls response
-    mock_supabase.table().select().in_().execute.return_value.data = [
-        {"id": 1, "title": "Poll 1", "description": "Test poll 1", "created_at": "2024-01-01"},
-        {"id": 2, "title": "Poll 2", "description": "Test poll 2", "created_at": "2024-01-02"}
+    mock_supabase.rpc.return_value.execute.return_value.data = [
+        {"id": 2, "title": "Poll 2", "description": "Test poll 2", "created_at": "2024-01-02",
+         "voters": 3, "last_vote_at": "2024-01-03T10:00:00+00:00", "leader": "Pizza", "leader_votes": 2},
+        {"id": 1, "title": "Poll 1", "description": "Test poll 1", "created_at": "2024-01-01",
+         "voters": 0, "last_vote_at": None, "leader": None, "leader_votes": None}
     ]
     
     db = PollDatabase(mock_supabase)
     result = db.get_user_polls(user_id=123)
     
+    # One round trip for the polls and their statistics
+    mock_supabase.rpc.assert_called_once_with("dashboard_polls", {
+        "p_user": 123, "p_before": None, "p_limit": DASHBOARD_PAGE_SIZE, "p_poll": None,
+    })
+    mock_supabase.table.assert_not_called()
     assert len(result) == 2
-    assert result[0]["title"] == "Poll 1"
-    assert result[1]["title"] == "Poll 2"
+    assert result[0]["title"] == "Poll 2"
+    assert result[0]["leader"] == "Pizza"
+    assert result[1]["voters"] == 0
+
+def test_get_user_polls_next_page():
+    """Test that the next page is fetched from after the last poll seen"""
+    mock_supabase = Mock()
+    mock_supabase.rpc.return_value.execute.return_value.data = []
+    
+    db = PollDatabase(mock_supabase)
+    db.get_user_polls(user_id=123, before=40, limit=10)
+    db.get_user_polls(user_id=123, poll_id=7)
+    
+    assert mock_supabase.rpc.call_args_list[0].args[1] == {"p_user": 123, "p_before": 40, "p_limit": 10, "p_poll": None}
+    assert mock_supabase.rpc.call_args_list[1].args[1]["p_poll"] == 7
 
 def test_get_user_polls_no_polls():
     """Test getting polls for a user who has no polls"""
     mock_supabase = Mock()
-    # Mock empty PollAdmins response
-    mock_supabase.table().select().eq().execute.return_value.data = []
+    mock_supabase.rpc.return_value.execute.return_value.data = []
     
     db = PollDatabase(mock_supabase)
     result = db.get_user_polls(user_id=123)
@@ -193,11 +321,11 @@ def test_get_votes_for_csv():
     
     # Mock votes data - simulate multiple votes from same user and different users
     mock_votes_data = [
-        {'user': 1, 'option': 101, 'created_at': '2025-01-01T10:00:00+00:00'},
-        {'user': 1, 'option': 102, 'created_at': '2025-01-01T10:00:01+00:00'},  # Same user, later timestamp
-        {'user': 2, 'option': 101, 'created_at': '2025-01-01T11:00:00+00:00'},
-        {'user': 3, 'option': 102, 'created_at': '2025-01-01T12:00:00+00:00'},
-        {'user': 3, 'option': 103, 'created_at': '2025-01-01T12:00:01+00:00'},
+        {'id': 1, 'user': 1, 'option': 101, 'created_at': '2025-01-01T10:00:00+00:00'},
+        {'id': 2, 'user': 1, 'option': 102, 'created_at': '2025-01-01T10:00:01+00:00'},  # Same user, later timestamp
+        {'id': 3, 'user': 2, 'option': 101, 'created_at': '2025-01-01T11:00:00+00:00'},
+        {'id': 4, 'user': 3, 'option': 102, 'created_at': '2025-01-01T12:00:00+00:00'},
+        {'id': 5, 'user': 3, 'option': 103, 'created_at': '2025-01-01T12:00:01+00:00'},
     ]
     
     # Mock poll options data
@@ -208,10 +336,9 @@ def test_get_votes_for_csv():
     ]
     
     # Set up mock responses
-    mock_supabase.table().select().eq().execute.side_effect = [
-        Mock(data=mock_votes_data),    # First call for votes
-        Mock(data=mock_options_data),  # Second call for options
-    ]
+    separate_tables(mock_supabase)
+    mock_supabase.table("PollOptions").select().eq().execute.return_value.data = mock_options_data
+    mock_supabase.table("Votes").select().eq().order().limit().execute.return_value.data = mock_votes_data
     
     db = PollDatabase(mock_supabase)
     user_votes, option_map = db.get_votes_for_csv(poll_id=1)
@@ -239,18 +366,222 @@ def test_get_votes_for_csv():
     assert user_votes[3]['user_id'] == 3
     assert user_votes[3]['votes'] == {102, 103}
 
+def test_poll_votes_read_ballots_and_legacy_votes():
+    """Test the dual read: Ballots first, then Votes rows of voters who have no ballot yet"""
+    mock_supabase = Mock()
+    separate_tables(mock_supabase, ballots=[
+        {'id': 1, 'user': 1, 'options': [101, 102], 'created_at': '2025-01-02T10:00:00+00:00'},
+        {'id': 2, 'user': 2, 'options': [], 'created_at': '2025-01-02T11:00:00+00:00'},
+    ])
+    mock_supabase.table("PollOptions").select().eq().execute.return_value.data = [
+        {'id': 101, 'option': 'Option A'},
+        {'id': 102, 'option': 'Option B'},
+    ]
+    mock_supabase.table("Votes").select().eq().order().limit().execute.return_value.data = [
+        {'id': 1, 'user': 1, 'option': 101, 'created_at': '2025-01-01T10:00:00+00:00'},  # replaced by the ballot
+        {'id': 2, 'user': 2, 'option': 102, 'created_at': '2025-01-01T11:00:00+00:00'},  # ballot emptied
+        {'id': 3, 'user': 3, 'option': 102, 'created_at': '2025-01-01T12:00:00+00:00'},
+    ]
+
+    db = PollDatabase(mock_supabase)
+    user_votes, option_map = db.get_votes_for_csv(poll_id=1)
+    assert user_votes == {
+        1: {'timestamp': '2025-01-02T10:00:00+00:00', 'user_id': 1, 'votes': {101, 102}},
+        3: {'timestamp': '2025-01-01T12:00:00+00:00', 'user_id': 3, 'votes': {102}},
+    }
+
+    snapshot = db.get_poll_snapshot(poll_id=1)
+    assert snapshot.candidates == {101: {1}, 102: {1, 3}}
+    assert snapshot.ballot_counts == {frozenset({101, 102}): 1, frozenset({102}): 1}
+
+def test_iter_ballots_keyset_pagination():
+    """Test that ballots are paged through like votes"""
+    mock_supabase = Mock()
+    query = mock_supabase.table().select().eq()
+    query.order().limit().execute.return_value.data = [{'id': 1}, {'id': 4}]
+    query.gt().order().limit().execute.side_effect = [Mock(data=[{'id': 6}]), Mock(data=[])]
+
+    db = PollDatabase(mock_supabase)
+    assert [ballot['id'] for ballot in db.iter_ballots(poll_id=1, page_size=2)] == [1, 4, 6]
+    assert [c.args for c in query.gt.call_args_list if c.args] == [('id', 4), ('id', 6)]
+
 def test_get_votes_for_csv_empty():
     """Test CSV function with no votes"""
     mock_supabase = Mock()
     
     # Mock empty responses
-    mock_supabase.table().select().eq().execute.side_effect = [
-        Mock(data=[]),  # No votes
-        Mock(data=[{'id': 101, 'option': 'Option A'}]),  # Has options
-    ]
+    separate_tables(mock_supabase)
+    mock_supabase.table("PollOptions").select().eq().execute.return_value.data = [{'id': 101, 'option': 'Option A'}]  # Has options
+    mock_supabase.table("Votes").select().eq().order().limit().execute.return_value.data = []  # No votes
     
     db = PollDatabase(mock_supabase)
     user_votes, option_map = db.get_votes_for_csv(poll_id=1)
     
     assert user_votes == {}
-    assert option_map == {101: 'Option A'} 
\ No newline at end of file
+    assert option_map == {101: 'Option A'} 
+
+def test_iter_votes_keyset_pagination():
+    """Test that votes are read page by page, continuing after the last seen ID"""
+    mock_supabase = Mock()
+    query = mock_supabase.table().select().eq()
+    query.order().limit().execute.return_value.data = [
+        {'id': 1, 'user': 101, 'option': 1},
+        {'id': 2, 'user': 102, 'option': 1},
+    ]
+    query.gt().order().limit().execute.side_effect = [
+        Mock(data=[{'id': 5, 'user': 101, 'option': 2}, {'id': 7, 'user': 103, 'option': 2}]),
+        # A page shorter than page_size isn't necessarily the last one
+        Mock(data=[{'id': 8, 'user': 104, 'option': 1}]),
+        Mock(data=[]),
+    ]
+
+    db = PollDatabase(mock_supabase)
+    votes = db.iter_votes(poll_id=1, page_size=2)
+
+    assert next(votes)['id'] == 1
+    # Later pages are only requested as the caller consumes rows
+    assert query.gt().order().limit().execute.call_count == 0
+    assert [vote['id'] for vote in votes] == [2, 5, 7, 8]
+    assert [c.args for c in query.gt.call_args_list if c.args] == [('id', 2), ('id', 7), ('id', 8)]
+
+def test_get_poll_snapshot():
+    """Test loading options and votes once and deriving all result views"""
+    mock_supabase = Mock()
+    mock_options_data = [
+        {'id': 102, 'option': 'Option B'},
+        {'id': 101, 'option': 'Option A'},
+    ]
+    mock_votes_data = [
+        {'id': 1, 'user': 1, 'option': 101, 'created_at': '2025-01-01T10:00:01+00:00'},
+        {'id': 2, 'user': 1, 'option': 102, 'created_at': '2025-01-01T10:00:00+00:00'},
+        {'id': 3, 'user': 2, 'option': 101, 'created_at': '2025-01-01T11:00:00+00:00'},
+        {'id': 4, 'user': 3, 'option': 101, 'created_at': '2025-01-01T12:00:00+00:00'},
+    ]
+    separate_tables(mock_supabase)
+    mock_supabase.table("PollOptions").select().eq().execute.return_value.data = mock_options_data
+    mock_supabase.table("Votes").select().eq().order().limit().execute.return_value.data = mock_votes_data
+
+    db = PollDatabase(mock_supabase)
+    snapshot = db.get_poll_snapshot(poll_id=1)
+
+    assert mock_supabase.table("PollOptions").select().eq().execute.call_count == 1
+    assert mock_supabase.table("Votes").select().eq().order().limit().execute.call_count == 1
+    assert list(snapshot.candidate_text.items()) == [(101, 'Option A'), (102, 'Option B')]
+    assert snapshot.candidates == {101: {1, 2, 3}, 102: {1}}
+    assert snapshot.ballot_counts == {frozenset({101, 102}): 1, frozenset({101}): 2}
+    assert snapshot.total_votes == 4
+    assert snapshot.user_votes[1]['timestamp'] == '2025-01-01T10:00:00+00:00'
+    assert snapshot.user_votes[1]['votes'] == {101, 102}
+
+def test_get_poll_ballots():
+    """Test building the tally inputs from ballots grouped by the database"""
+    mock_supabase = Mock()
+    mock_supabase.table().select().eq().execute.return_value.data = [
+        {'id': 102, 'option': 'Option B', 'winner': True, 'vote_tally': 1},
+        {'id': 101, 'option': 'Option A'},
+        {'id': 103, 'option': 'Option C'},
+    ]
+    mock_supabase.rpc().execute.return_value.data = [
+        {'options': [101, 102], 'voters': 1},
+        {'options': [101], 'voters': 2},
+    ]
+
+    db = PollDatabase(mock_supabase)
+    snapshot = db.get_poll_ballots(poll_id=1)
+
+    mock_supabase.rpc.assert_called_with("poll_ballots", {"p_poll": 1})
+    mock_supabase.table().select().eq().order().limit().execute.assert_not_called()
+    assert list(snapshot.candidate_text.items()) == [(101, 'Option A'), (102, 'Option B'), (103, 'Option C')]
+    assert snapshot.ballot_counts == {frozenset({101, 102}): 1, frozenset({101}): 2}
+    assert {c: len(voters) for c, voters in snapshot.candidates.items()} == {101: 3, 102: 1, 103: 0}
+    assert len(snapshot.candidates[101] & snapshot.candidates[102]) == 1
+    assert snapshot.total_votes == 4
+    assert snapshot.stored_results[102] == (True, 1)
+    assert snapshot.user_votes == {}
+
+def test_save_poll_results_bulk_upsert():
+    """Test that results for all options are written in a single upsert"""
+    mock_supabase = Mock()
+    db = PollDatabase(mock_supabase)
+    candidate_text = {101: 'Option A', 102: 'Option B', 103: 'Option C'}
+    vote_tally = {101: 5, 102: 3, 103: 1}
+
+    assert db.save_poll_results(1, {101}, candidate_text, vote_tally) is True
+
+    upsert = mock_supabase.table.return_value.upsert
+    upsert.assert_called_once()
+    upsert.return_value.execute.assert_called_once()
+    rows = upsert.call_args[0][0]
+    assert [(row['id'], row['winner'], row['vote_tally']) for row in rows] == [
+        (101, True, 5), (102, False, 3), (103, False, 1)
+    ]
+
+def test_save_poll_results_skips_unchanged():
+    """Test that no write happens when stored results already match"""
+    mock_supabase = Mock()
+    db = PollDatabase(mock_supabase)
+    candidate_text = {101: 'Option A', 102: 'Option B'}
+    vote_tally = {101: 5, 102: 3}
+
+    stored_results = {101: (True, 5), 102: (False, 3)}
+    assert db.save_poll_results(1, {101}, candidate_text, vote_tally, stored_results) is False
+    mock_supabase.table().upsert().execute.assert_not_called()
+
+    stored_results = {101: (True, 4), 102: (False, 3)}
+    assert db.save_poll_results(1, {101}, candidate_text, vote_tally, stored_results) is True
+    mock_supabase.table().upsert().execute.assert_called_once()
+
+def test_create_poll_with_options():
+    """Test that a poll, its admin and its options are created in one call"""
+    mock_supabase = Mock()
+    mock_supabase.rpc().execute.return_value.data = 42
+
+    db = PollDatabase(mock_supabase)
+    poll_id = db.create_poll_with_options(123, "Lunch", "Where to eat", "", 2, False, ["Tacos", "Pho", "Pizza"])
+
+    assert poll_id == 42
+    mock_supabase.rpc.assert_called_with("create_poll_with_options", {
+        "p_user": 123,
+        "p_title": "Lunch",
+        "p_description": "Where to eat",
+        "p_cover_photo": "",
+        "p_seats": 2,
+        "p_email_verification": False,
+        "p_options": ["Tacos", "Pho", "Pizza"]
+    })
+    mock_supabase.table.assert_not_called()
+
+def test_add_poll_options_bulk_insert():
+    """Test that all options are inserted in one call"""
+    mock_supabase = Mock()
+    db = PollDatabase(mock_supabase)
+    db.add_poll_options(7, ["Tacos", "Pho"])
+
+    insert = mock_supabase.table.return_value.insert
+    insert.assert_called_once_with([{"option": "Tacos", "poll": 7}, {"option": "Pho", "poll": 7}])
+    insert.return_value.execute.assert_called_once()
+
+def test_vote_changes_bump_results_cache():
+    """Test that writes which change votes invalidate cached results"""
+    mock_supabase = Mock()
+    results_cache = Mock()
+    db = PollDatabase(mock_supabase, results_cache)
+
+    db.save_votes("3", 123, ["1|Option 1"])
+    results_cache.bump.assert_called_once_with(3)
+
+    mock_supabase.rpc().execute.return_value.data = {"status": "unknown_user", "user_id": None}
+    db.submit_ballot(4, "new@example.com", ["1|Option 1"])
+    results_cache.bump.assert_called_once_with(3)
+
+    mock_supabase.rpc().execute.return_value.data = {"status": "saved", "user_id": 123}
+    db.submit_ballot(4, "test@example.com", ["1|Option 1"])
+    results_cache.bump.assert_called_with(4)
+
+    mock_supabase.rpc().execute.return_value.data = {"deleted": [5], "missing": []}
+    db.delete_poll(5, 123)
+    results_cache.discard.assert_called_once_with(5)
+
+    mock_supabase.rpc().execute.return_value.data = 123
+    db.delete_user('test@example.com')
+    results_cache.bump_all.assert_called_once()
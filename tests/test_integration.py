@@ -138,3 +138,40 @@ def test_csv_download_nonexistent_poll(client):
     if rv.status_code == 200:
         # If it returns 200, should still be valid CSV format
         assert 'text/csv' in rv.content_type
+
+def test_vote_page_conditional_get(client):
+    """Test the vote page answers 304 when the client's cached copy is current"""
+    rv = client.get('/vote/17')
+    assert rv.status_code == 200
+    assert 'max-age' in rv.headers['Cache-Control']
+    etag = rv.headers['ETag']
+
+    rv = client.get('/vote/17', headers={'If-None-Match': etag})
+    assert rv.status_code == 304
+    assert rv.data == b''
+    assert rv.headers['ETag'] == etag
+
+def test_results_rounds_url_is_versioned(client):
+    """Test the results page fetches its rounds from a URL that changes with the results"""
+    rv = client.get('/results/17')
+    etag = rv.headers['ETag'].strip('"')
+    assert f'/api/results/17/rounds?v={etag}'.encode() in rv.data
+
+    rv = client.get(f'/api/results/17/rounds?v={etag}')
+    assert 'max-age' in rv.headers['Cache-Control']
+    rv = client.get('/api/results/17/rounds?v=older')
+    assert rv.headers['Cache-Control'] == 'no-cache'
+
+def test_results_page_conditional_get(client):
+    """Test the results page and its rounds answer 304 while the results are unchanged"""
+    for route in ['/results/17', '/api/results/17/rounds']:
+        rv = client.get(route)
+        assert rv.status_code == 200
+        assert rv.headers['Last-Modified']
+
+        rv = client.get(route, headers={'If-None-Match': rv.headers['ETag']})
+        assert rv.status_code == 304
+        assert rv.data == b''
+
+    rv = client.get('/results/17', headers={'If-None-Match': '"stale"'})
+    assert rv.status_code == 200
@@ -0,0 +1,81 @@
+import os
+import pytest
+import migrate
+from migrate import MIGRATIONS_DIR, baseline_versions, main, migration_files, out_of_order, pending_migrations
+
+def test_migration_files_in_version_order(tmp_path):
+    for name in ["0002_b.sql", "0000_baseline.sql", "0001_a.sql", "notes.txt", "0003_draft.sql.bak"]:
+        (tmp_path / name).write_text("select 1;")
+    migrations = migration_files(str(tmp_path))
+    assert [version for version, _ in migrations] == ["0000", "0001", "0002"]
+    assert migrations[2][1] == os.path.join(str(tmp_path), "0002_b.sql")
+
+def test_migration_files_rejects_duplicate_versions(tmp_path):
+    (tmp_path / "0001_a.sql").write_text("select 1;")
+    (tmp_path / "0001_b.sql").write_text("select 1;")
+    with pytest.raises(ValueError, match="0001"):
+        migration_files(str(tmp_path))
+
+def test_pending_migrations_skips_applied():
+    migrations = [("0000", "a"), ("0001", "b"), ("0002", "c")]
+    assert pending_migrations(migrations, {"0000", "0002"}) == [("0001", "b")]
+    assert pending_migrations(migrations, set()) == migrations
+
+def test_repo_migrations_are_numbered_in_sequence():
+    versions = [version for version, _ in migration_files(MIGRATIONS_DIR)]
+    assert versions == [f"{n:04d}" for n in range(len(versions))]
+    assert len(versions) == len(os.listdir(MIGRATIONS_DIR))
+
+def test_out_of_order_migrations():
+    pending = [("0001", "b"), ("0004", "e")]
+    assert out_of_order(pending, {"0000", "0002", "0003"}) == [("0001", "b")]
+    assert out_of_order(pending, set()) == []
+
+def test_baseline_versions():
+    migrations = [("0000", "a"), ("0001", "b"), ("0002", "c")]
+    assert baseline_versions(migrations, "0001") == ["0000", "0001"]
+    with pytest.raises(ValueError, match="0009"):
+        baseline_versions(migrations, "0009")
+
+@pytest.fixture
+def database_url():
+    """An empty scratch database, from TEST_DATABASE_URL; its public schema is dropped afterwards"""
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("set TEST_DATABASE_URL to an empty scratch Postgres database")
+    psycopg = pytest.importorskip("psycopg")
+    yield url
+    with psycopg.connect(url, autocommit=True) as connection:
+        connection.execute("drop schema public cascade; create schema public")
+
+def test_migrations_apply_twice_in_a_row(database_url, capsys):
+    main([database_url])
+    assert "applying 0000_baseline_schema.sql" in capsys.readouterr().out
+    main([database_url])
+    assert capsys.readouterr().out == "Database is up to date\n"
+
+    # A database migrated by hand has the tables but no record of the migrations
+    import psycopg
+    with psycopg.connect(database_url, autocommit=True) as connection:
+        connection.execute("delete from schema_migrations")
+    with pytest.raises(SystemExit, match="--baseline"):
+        main([database_url])
+    last = migration_files()[-1][0]
+    main(["--baseline", last, database_url])
+    assert capsys.readouterr().out.endswith("Database is up to date\n")
+
+def test_failed_migration_keeps_earlier_ones(database_url, tmp_path, monkeypatch):
+    # The repo's migrations followed by one that fails, applied to an empty schema
+    for version, path in migration_files():
+        (tmp_path / os.path.basename(path)).write_text(open(path).read())
+    (tmp_path / "9999_fails.sql").write_text("select 1 / 0;")
+    monkeypatch.setattr(migrate, "migration_files", lambda: migration_files(str(tmp_path)))
+
+    import psycopg
+    with pytest.raises(psycopg.errors.DivisionByZero):
+        main([database_url])
+
+    # Each migration ran in its own transaction, so only the failing one was rolled back
+    with psycopg.connect(database_url) as connection:
+        applied = {row[0] for row in connection.execute("select version from schema_migrations")}
+    assert applied == {version for version, _ in migration_files()}
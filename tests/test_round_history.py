@@ -0,0 +1,92 @@
+import json
+import pickle
+import pytest
+from round_history import RoundHistory
+
+def make_history():
+    # Step 0: 1 wins; its ballots are removed and {1, 2} passes 0.5 on to {2}
+    history = RoundHistory({frozenset({1}): 2, frozenset({1, 2}): 1, frozenset({3}): 1},
+                           {1: {"a", "b", "c"}, 2: {"c"}, 3: {"d"}})
+    history.add_rounds([1], 3)
+    history.advance([frozenset({1}), frozenset({1, 2})], {frozenset({2}): 0.5}, [1])
+    # Step 1: 2 and 3 tie
+    history.add_rounds([3, 2], 1)
+    return history
+
+def test_round_history_materializes_rounds():
+    history = make_history()
+    assert len(history) == 3
+    assert dict(history[0]) == {
+        "ballot_counts": {frozenset({1}): 2, frozenset({1, 2}): 1, frozenset({3}): 1},
+        "votes_per_candidate": {1: {"a", "b", "c"}, 2: {"c"}, 3: {"d"}},
+        "winner": 1, "is_tie": True, "tie_group": [1], "winner_tally": 3
+    }
+    assert history[1]["ballot_counts"] == {frozenset({3}): 1, frozenset({2}): 0.5}
+    assert list(history[1]["ballot_counts"]) == [frozenset({3}), frozenset({2})]
+    assert history[1]["votes_per_candidate"] == {2: {"c"}, 3: {"d"}}
+    assert history[-1]["winner"] == 2
+    assert history[2]["tie_group"] == [3, 2]
+
+def test_round_history_reads_rounds_out_of_order():
+    history = make_history()
+    assert history[2]["ballot_counts"] == {frozenset({3}): 1, frozenset({2}): 0.5}
+    assert history[0]["ballot_counts"] == {frozenset({1}): 2, frozenset({1, 2}): 1, frozenset({3}): 1}
+    assert history[1]["ballot_counts"] == history[2]["ballot_counts"]
+
+def test_round_history_empty_round():
+    history = RoundHistory({}, {1: set()})
+    history.add_rounds([], None)
+    assert len(history) == 1
+    assert "winner" not in history[0]
+    assert history[0].get("winner") is None
+    assert dict(history[0]) == {"ballot_counts": {}, "votes_per_candidate": {1: set()}}
+    with pytest.raises(IndexError):
+        history[1]
+
+def test_round_history_equals_round_dicts():
+    history = make_history()
+    assert history == [dict(view) for view in history]
+    assert history[:2] == [history[0], history[1]]
+
+def test_round_history_pickles_without_cached_state():
+    history = make_history()
+    history[2]["ballot_counts"]
+    restored = pickle.loads(pickle.dumps(history))
+    assert restored.last_state[0] == 0
+    assert restored == history
+
+def expand_compact(compact):
+    # What the results page does with the payload: replay the steps, then read each round's ballots
+    ballots = [frozenset(compact["candidates"][i] for i in ballot) for ballot in compact["ballots"]]
+    states = [dict(compact["initial"])]
+    for step in compact["steps"]:
+        state = dict(states[-1])
+        for ballot in step["removed"]:
+            del state[ballot]
+        state.update(dict(step["changed"]))
+        states.append(state)
+    return [{ballots[b]: count for b, count in states[round_data["step"]].items()}
+            for round_data in compact["rounds"]]
+
+def test_round_history_to_compact():
+    history = make_history()
+    compact = history.to_compact([3, 2, 1], {1: 3, 2: 1, 3: 1})
+    assert compact["candidates"] == [3, 2, 1]
+    assert compact["approvals"] == [1, 1, 3]
+    assert compact["rounds"] == [
+        {"step": 0, "winner": 2, "tie_group": [2], "tally": 3},
+        {"step": 1, "winner": 0, "tie_group": [0, 1], "tally": 1},
+        {"step": 1, "winner": 1, "tie_group": [0, 1], "tally": 1}
+    ]
+    assert expand_compact(compact) == [view["ballot_counts"] for view in history]
+    assert [list(ballots) for ballots in expand_compact(compact)] == [list(view["ballot_counts"]) for view in history]
+
+def test_round_history_to_compact_rounds_counts():
+    history = RoundHistory({frozenset({1, 2}): 1}, {1: {"a"}, 2: {"a"}})
+    history.add_rounds([1], 1)
+    history.advance([frozenset({1, 2})], {frozenset({2}): 1 / 3}, [1])
+    history.add_rounds([], None)
+    compact = history.to_compact([1, 2], {1: 1, 2: 1})
+    assert compact["steps"] == [{"removed": [0], "changed": [[1, 0.333333]]}]
+    assert compact["rounds"][1] == {"step": 1}
+    assert json.loads(json.dumps(compact)) == compact
@@ -1,11 +1,21 @@
+import random
 import pytest
+from voter_index import VoterIndex
 from vote_utils import (
     format_vote_confirmation, 
     format_winners_text, 
     calculate_vote_overlap,
     sorted_candidate_sets,
     votes_by_candidate,
-    votes_by_number_of_candidates
+    votes_by_number_of_candidates,
+    excess_vote_rounds,
+    excess_vote_rounds_bitmask,
+    excess_vote_rounds_numpy,
+    get_tally_engine,
+    TALLY_ENGINES,
+    RoundTrace,
+    tie_groups,
+    votes_needed_table
 )
 
 def test_format_vote_confirmation_single_vote():
@@ -60,6 +70,42 @@ def test_sorted_candidate_sets_single_seat():
     assert result[0][0] == 2  # First candidate has 2 votes
     assert result[0][1] == (1,)  # Candidate ID 1 won
 
+def test_sorted_candidate_sets_scores_each_set_separately():
+    candidates = {
+        1: {101, 102, 103},
+        2: {102, 103},
+        3: {104},
+    }
+    result = sorted_candidate_sets(2, candidates)
+    # {1, 2}: 101 approves one (1), 102 and 103 approve both (1 + 1/2 each)
+    # {1, 3}: four voters approve one each; equal scores are ordered by set, descending
+    assert result[0] == (4.0, (1, 3))
+    assert result[1] == (4.0, (1, 2))
+    assert result[2] == (3.0, (2, 3))
+
+def test_sorted_candidate_sets_top_k_matches_full_ranking():
+    for seed in range(50):
+        seats, candidates, _ = random_election(seed)
+        ranked = sorted_candidate_sets(seats, candidates)
+        for top_k in (1, 3):
+            assert sorted_candidate_sets(seats, candidates, top_k=top_k) == ranked[:top_k]
+
+def test_sorted_candidate_sets_with_workers_matches_serial():
+    for seed in range(5):
+        seats, candidates, _ = random_election(seed)
+        for top_k in (None, 2):
+            assert sorted_candidate_sets(seats, candidates, top_k=top_k, workers=2) == \
+                sorted_candidate_sets(seats, candidates, top_k=top_k)
+
+def test_candidate_sets_with_voter_sets_match_plain_sets():
+    for seed in range(20):
+        seats, candidates, _ = random_election(seed)
+        index = VoterIndex()
+        voter_sets = {c: index.voter_set(voters) for c, voters in candidates.items()}
+        assert sorted_candidate_sets(seats, voter_sets) == sorted_candidate_sets(seats, candidates)
+        winning_set = list(candidates)[:seats]
+        assert calculate_vote_overlap(winning_set, voter_sets) == calculate_vote_overlap(winning_set, candidates)
+
 def test_votes_by_number_of_candidates():
     candidates = {
         1: {101, 102},  # Users 101 and 102 voted for candidate 1
@@ -69,4 +115,137 @@ def test_votes_by_number_of_candidates():
     result = votes_by_number_of_candidates(winning_set, candidates)
     assert len(result) == 2
     assert len(result[0]) == 2  # Two users voted for exactly one candidate
-    assert len(result[1]) == 1  # One user voted for both candidates 
\ No newline at end of file
+    assert len(result[1]) == 1  # One user voted for both candidates
+
+def random_election(seed):
+    """Random candidate -> voters map and matching ballot counts"""
+    rng = random.Random(seed)
+    candidate_ids = rng.sample(range(1, 200), rng.randint(2, 8))
+    candidates = {c: set() for c in candidate_ids}
+    ballot_counts = {}
+    for voter in range(rng.randint(1, 40)):
+        ballot = frozenset(rng.sample(candidate_ids, rng.randint(1, min(3, len(candidate_ids)))))
+        for c in ballot:
+            candidates[c].add(voter)
+        ballot_counts[ballot] = ballot_counts.get(ballot, 0) + 1
+    seats = rng.randint(1, len(candidate_ids) - 1)
+    return seats, candidates, ballot_counts
+
+def test_excess_vote_rounds_bitmask_matches_excess_vote_rounds():
+    # Include a tie (1 and 2 both have 2 votes) and fractional redistribution
+    cases = [(2, {1: {101, 103}, 2: {102, 103}, 3: {104}},
+              {frozenset({1}): 1, frozenset({2}): 1, frozenset({1, 2}): 1, frozenset({3}): 1})]
+    cases += [random_election(seed) for seed in range(200)]
+    for seats, candidates, ballot_counts in cases:
+        expected_candidates = dict(candidates)
+        try:
+            expected = excess_vote_rounds(seats, expected_candidates, dict(ballot_counts))
+        except ValueError:
+            # No candidates left to set the threshold; both engines fail the same way
+            with pytest.raises(ValueError):
+                excess_vote_rounds_bitmask(seats, dict(candidates), dict(ballot_counts))
+            continue
+        actual_candidates = dict(candidates)
+        actual = excess_vote_rounds_bitmask(seats, actual_candidates, dict(ballot_counts))
+        assert actual == expected
+        assert [r.get("winner") for r in actual] == [r.get("winner") for r in expected]
+        assert actual_candidates == expected_candidates
+
+def has_near_tie(rounds):
+    """True if some round's top tallies differ only by float rounding"""
+    for round_data in rounds:
+        tallies = {}
+        for ballot, count in round_data["ballot_counts"].items():
+            for candidate in ballot:
+                tallies[candidate] = tallies.get(candidate, 0) + count
+        values = sorted(tallies.values(), reverse=True)
+        if len(values) > 1 and values[0] != values[1] and values[0] - values[1] < 1e-9 * values[0]:
+            return True
+    return False
+
+def test_excess_vote_rounds_numpy_matches_bitmask():
+    pytest.importorskip("numpy")
+    for seed in range(200):
+        seats, candidates, ballot_counts = random_election(seed)
+        try:
+            expected = excess_vote_rounds_bitmask(seats, dict(candidates), dict(ballot_counts))
+        except ValueError:
+            continue
+        if has_near_tie(expected):
+            continue
+        actual = excess_vote_rounds_numpy(seats, dict(candidates), dict(ballot_counts))
+        assert [r.get("winner") for r in actual] == [r.get("winner") for r in expected]
+        for actual_round, expected_round in zip(actual, expected):
+            assert actual_round["votes_per_candidate"] == expected_round["votes_per_candidate"]
+            assert list(actual_round["ballot_counts"]) == list(expected_round["ballot_counts"])
+            assert actual_round["ballot_counts"] == pytest.approx(expected_round["ballot_counts"], rel=1e-9)
+
+def test_get_tally_engine():
+    assert get_tally_engine("bitmask") is excess_vote_rounds_bitmask
+    assert get_tally_engine("sets") is excess_vote_rounds
+    assert get_tally_engine("missing") is excess_vote_rounds_bitmask
+    if "numpy" in TALLY_ENGINES:
+        assert get_tally_engine("numpy") is excess_vote_rounds_numpy
+
+def test_excess_vote_rounds_prints_nothing(capsys):
+    seats, candidates, ballot_counts = random_election(3)
+    for engine in TALLY_ENGINES.values():
+        engine(seats, dict(candidates), dict(ballot_counts))
+    assert capsys.readouterr().out == ""
+
+def test_round_trace_records_rounds():
+    # 1 wins the first round with 3 votes; its excess of 1 goes to the {1, 2} ballot's 2
+    ballot_counts = {frozenset({1}): 2, frozenset({1, 2}): 1, frozenset({2}): 1, frozenset({3}): 1}
+    candidates = {1: {1, 2, 3}, 2: {3, 4}, 3: {5}}
+    for name, engine in TALLY_ENGINES.items():
+        trace = RoundTrace()
+        rounds = engine(2, dict(candidates), dict(ballot_counts), trace=trace)
+        assert rounds == engine(2, dict(candidates), dict(ballot_counts)), name
+
+        kinds = [event["event"] for event in trace.events]
+        assert kinds == ["start", "round", "winners", "redistribute", "round", "winners", "end"], name
+        assert trace.events[1]["vote_counts"] == {1: 3, 2: 2, 3: 1}
+        assert trace.events[2]["winners"] == [1]
+        redistribute = trace.events[3]
+        assert redistribute["threshold"] == 2 and redistribute["excess"] == 1
+        transfers = [t for t in redistribute["transfers"] if t[1] is not None]
+        assert transfers == [(frozenset({1, 2}), frozenset({2}), pytest.approx(1 / 3))]
+        assert trace.events[-1]["winners"] == [1, 2]
+
+        data = trace.to_dict()
+        assert data["events"][1]["vote_counts"] == {"1": 3, "2": 2, "3": 1}
+        assert data["events"][3]["transfers"][-1]["to"] == [2]
+        lines = trace.lines({1: "Apple", 2: "Banana", 3: "Cherry"})
+        assert lines[-1] == "Winners in order: Apple, Banana"
+
+def test_votes_needed_table():
+    # 1 wins with 3 votes, then 2 (2 votes, 1 shared with 1) beats 3 after redistribution
+    ballot_counts = {frozenset({1}): 2, frozenset({1, 2}): 1, frozenset({2}): 1, frozenset({3}): 1}
+    candidates = {1: {"a", "b", "c"}, 2: {"c", "d"}, 3: {"e"}}
+    rounds = excess_vote_rounds_bitmask(2, dict(candidates), ballot_counts)
+    table = votes_needed_table(rounds, candidates, 2)
+
+    assert table[1] == {"votes": 3, "is_winner": True, "positions": [
+        {"position": 1, "winners": [1], "won": True, "winner_votes": 3,
+         "with_previous_winners": None, "without_previous_winners": None}]}
+
+    second = table[2]["positions"]
+    assert second[0]["won"] is False and second[0]["votes_needed"] == 2
+    assert second[1] == {"position": 2, "winners": [2], "won": True, "winner_votes": 2,
+                         "with_previous_winners": 1, "without_previous_winners": 1}
+
+    third = table[3]
+    assert third["is_winner"] is False
+    assert [p["votes_needed"] for p in third["positions"]] == [3, 1]
+    assert third["positions"][1]["excluded"] == [1, 2]
+    assert third["positions"][1]["redistributed"] is True
+
+def test_rounds_report_tie_groups():
+    # 1 and 2 tie with 2 votes each, then 3 wins the last seat
+    ballot_counts = {frozenset({1}): 1, frozenset({2}): 1, frozenset({1, 2}): 1, frozenset({3}): 1}
+    candidates = {1: {101, 103}, 2: {102, 103}, 3: {104}}
+    for name, engine in TALLY_ENGINES.items():
+        rounds = engine(3, dict(candidates), dict(ballot_counts))
+        assert [r["tie_group"] for r in rounds] == [[1, 2], [1, 2], [3]], name
+        assert [r["winner_tally"] for r in rounds] == [2, 2, 1], name
+        assert tie_groups(rounds) == [[1, 2], [3]], name
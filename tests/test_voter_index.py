@@ -0,0 +1,66 @@
+import pickle
+from voter_index import VoterIndex, VoterSet
+
+def test_voter_index_numbers_users_in_order():
+    index = VoterIndex(["a", "b"])
+    assert index.row("a") == 0
+    assert index.row("c") == 2
+    assert index.users == ["a", "b", "c"]
+    assert len(index) == 3
+
+def test_voter_set_behaves_like_a_set():
+    index = VoterIndex()
+    voters = index.voter_set(["u1", "u2", "u3"])
+    assert len(voters) == 3
+    assert "u2" in voters
+    assert "u4" not in voters
+    assert set(voters) == {"u1", "u2", "u3"}
+    assert voters == {"u1", "u2", "u3"}
+    assert {"u1", "u2", "u3"} == voters
+    assert voters != {"u1"}
+
+def test_voter_set_operations_use_bits():
+    index = VoterIndex()
+    a = index.voter_set(["u1", "u2", "u3"])
+    b = index.voter_set(["u3", "u4"])
+    assert (a & b).bits == index.voter_set(["u3"]).bits
+    assert a | b == {"u1", "u2", "u3", "u4"}
+    assert a - b == {"u1", "u2"}
+    assert a ^ b == {"u1", "u2", "u4"}
+    assert isinstance(a & b, VoterSet)
+    assert not a.isdisjoint(b)
+    assert a.intersection(["u1", "u4"]) == {"u1"}
+    assert len(a - a) == 0
+
+def test_voter_set_mixes_with_plain_sets():
+    index = VoterIndex()
+    voters = index.voter_set(["u1", "u2"])
+    assert voters & {"u2", "u9"} == {"u2"}
+    assert {"u2", "u9"} & voters == {"u2"}
+    assert voters | set() == {"u1", "u2"}
+    assert voters - {"u1"} == {"u2"}
+
+def test_voter_set_rows_and_large_sets():
+    index = VoterIndex(range(100000))
+    voters = index.from_rows(range(0, 100000, 3))
+    assert len(voters) == 33334
+    assert list(voters.rows())[:3] == [0, 3, 6]
+    assert 99999 in voters
+    assert 99998 not in voters
+
+def test_voter_set_pickles_with_shared_index():
+    index = VoterIndex()
+    a = index.voter_set(["u1", "u2"])
+    b = index.voter_set(["u2"])
+    a2, b2 = pickle.loads(pickle.dumps((a, b)))
+    assert a2.index is b2.index
+    assert a2 & b2 == {"u2"}
+
+def test_voter_set_from_runs_of_anonymous_voters():
+    index = VoterIndex()
+    assert index.add_anonymous(5) == 0
+    voters = index.from_runs([(True, 2), (False, 1), (True, 2)])
+    assert list(voters.rows()) == [0, 1, 3, 4]
+    assert voters == {0, 1, 3, 4}
+    assert len(index.from_runs([(False, 5)])) == 0
+    assert len(index.from_runs([])) == 0
@@ -1,4 +1,15 @@
-import itertools
+import heapq
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from database import PollDatabase
+from round_history import RoundHistory
+from voter_index import VoterSet
+
+try:
+    import numpy as np
+except ImportError:  # the numpy engine is optional; the bitmask engine needs nothing extra
+    np = None
 
 def format_vote_confirmation(selected_options, poll_id):
     option_names = []
@@ -89,67 +100,411 @@ def format_winners_text(winning_set, candidate_text, seats, is_tie=False):
 def calculate_vote_overlap(winning_set, candidates):
     vote_overlap = []
     for c in range(len(winning_set)):
-        vote_overlap.append(set())
         votes = candidates[winning_set[c]]
+        # Empty set of the same kind as the candidates' voters (set or VoterSet)
+        vote_overlap.append(votes - votes)
         for i in range(0,c):
-            promote = vote_overlap[i].intersection(votes)
+            promote = vote_overlap[i] & votes
             vote_overlap[i] = vote_overlap[i] - promote
-            vote_overlap[i+1] = vote_overlap[i+1].union(promote)
+            vote_overlap[i+1] = vote_overlap[i+1] | promote
             votes = votes - promote
-        vote_overlap[0] = vote_overlap[0].union(votes)
+        vote_overlap[0] = vote_overlap[0] | votes
     return vote_overlap
 
-def sorted_candidate_sets(seats, candidates):
+def sorted_candidate_sets(seats, candidates, top_k=None, workers=None):
+    """
+    Winning sets of `seats` candidates, best first, as (score, winning_set) pairs.
+    A set scores 1 for each voter who approved one of its candidates, 1 + 1/2 for
+    each who approved two, 1 + 1/2 + 1/3 for three, and so on. Sets are tuples in
+    candidates' key order, and equal scores are ordered by winning_set descending.
+    With top_k, only the best top_k sets are returned (see search_candidate_sets).
+    With workers > 1, the search is spread over that many processes.
+    """
     if seats == 1:
-        return list(sorted(zip([len(candidates[k]) for k in candidates.keys()], 
+        ranked = list(sorted(zip([len(candidates[k]) for k in candidates.keys()], 
                              [(k,) for k in candidates.keys()]), reverse=True))
-    
-    winning_sets = []
-    total_votes = []
-    for combination in itertools.combinations(candidates.keys(), seats):
-        winning_sets.append(combination)
-    
-    multiplier = 1
-    for winning_set in winning_sets:
-        vote_overlap = calculate_vote_overlap(winning_set, candidates)
-        total = 0
-        for c in range(len(winning_set)):
-            if c != 0:
-                multiplier += 1/(c+1)
-            total += len(vote_overlap[c])*multiplier
-        total_votes.append(total)
-    
-    return sorted(zip(total_votes, winning_sets), reverse=True)
+        return ranked if top_k is None else ranked[:top_k]
+
+    scale, ranked = search_candidate_sets(seats, candidates, top_k, workers)
+    return [(score / scale, winning_set) for score, winning_set in ranked]
+
+def harmonic_weights(seats):
+    """
+    Integer weights for approving 0..seats members of a winning set, scaled so that
+    weights[j] / scale is the harmonic number 1 + 1/2 + ... + 1/j. Returns (scale, weights).
+    """
+    scale = math.lcm(*range(1, seats + 1)) if seats > 0 else 1
+    weights = [0]
+    for j in range(1, seats + 1):
+        weights.append(weights[-1] + scale // j)
+    return scale, weights
+
+def search_candidate_sets(seats, candidates, top_k=None, workers=None):
+    """
+    Branch-and-bound search for the best-scoring winning sets in sorted_candidate_sets.
+    Returns (scale, [(score, winning_set), ...]) with integer scores (divide by scale
+    for the harmonic score), best first.
+
+    Voters are bits in an int per candidate. The search adds one candidate at a time,
+    tracking which voters approve exactly j of the chosen candidates (level j), so a
+    candidate's gain is a few popcounts and a set's score is updated incrementally
+    rather than recomputed from scratch. A candidate's gain can only shrink as the set
+    grows, so the current score plus the largest remaining gains bounds every
+    completion of a partial set, and branches that can't reach the top_k are skipped.
+    The bound only prunes branches that are strictly worse, so the top_k are exact.
+
+    With workers > 1 the sets are split by their first candidate in search order and
+    searched in a process pool. Each worker gets the voter bitmaps once, when it starts,
+    and returns its own top_k, which are merged here. Workers share the best pruning
+    threshold any of them has reached, since a shard's k-th best score is a lower bound
+    on the overall k-th best.
+    """
+    keys = list(candidates.keys())
+    if seats > len(keys) or seats < 1:
+        return 1, []
+
+    voter_bits = {}
+    approvals = {}
+    voter_sets = [candidates[key] for key in keys]
+    if all(isinstance(voters, VoterSet) and voters.index is voter_sets[0].index for voters in voter_sets):
+        # Already bitmaps over the same voter numbering
+        approvals = {key: voters.bits for key, voters in zip(keys, voter_sets)}
+        voter_count = len(voter_sets[0].index)
+    else:
+        for key in keys:
+            mask = 0
+            for voter in candidates[key]:
+                if voter not in voter_bits:
+                    voter_bits[voter] = 1 << len(voter_bits)
+                mask |= voter_bits[voter]
+            approvals[key] = mask
+        voter_count = len(voter_bits)
+    # Search candidates with the most approvals first so good sets are found early
+    # and the pruning threshold rises quickly
+    order = sorted(keys, key=lambda k: approvals[k].bit_count(), reverse=True)
+    # Workers identify candidates by their rank among the sorted keys, so comparing
+    # winning sets of ranks orders them the same way as winning sets of keys
+    sorted_keys = sorted(keys)
+    rank = {key: index for index, key in enumerate(sorted_keys)}
+    position = {key: index for index, key in enumerate(keys)}
+    search = CandidateSetSearch(seats, [approvals[k] for k in order],
+                                [rank[k] for k in order], [position[k] for k in order], top_k)
+
+    first_choices = range(len(order) - seats + 1)
+    if workers is not None and workers > 1 and len(first_choices) > 1:
+        # Scores are at most voters * scale * seats; only share them if they fit a 64-bit int
+        threshold = multiprocessing.RawValue("q", -1) if voter_count * search.scale * seats < 2**63 else None
+        with ProcessPoolExecutor(min(workers, len(first_choices)), initializer=start_search_worker,
+                                 initargs=(search, threshold)) as pool:
+            shards = list(pool.map(search_worker, first_choices))
+        found = [entry for shard in shards for entry in shard]
+        ranked = heapq.nlargest(top_k, found) if top_k is not None else sorted(found, reverse=True)
+    else:
+        ranked = search.run()
+    return search.scale, [(score, tuple(sorted_keys[r] for r in ranks)) for score, ranks in ranked]
+
+class CandidateSetSearch:
+    """
+    The depth-first search behind search_candidate_sets, over candidates in search order.
+    masks[i] is the voter bitmap of the ith candidate, ranks[i] its rank among the sorted
+    candidate IDs and positions[i] its position in the candidates dict. Small enough to
+    send to worker processes: just ints and lists of ints.
+    """
+    def __init__(self, seats, masks, ranks, positions, top_k=None):
+        self.seats = seats
+        self.masks = masks
+        self.ranks = ranks
+        self.positions = positions
+        self.top_k = top_k
+        # Pruning threshold shared between worker processes (a RawValue), if any
+        self.shared_threshold = None
+        self.scale, weights = harmonic_weights(seats)
+        # steps[j] = what a voter adds to the score when a set gains a j+1th candidate they approve
+        self.steps = [weights[j + 1] - weights[j] for j in range(seats)]
+
+    def run(self, first=None):
+        """
+        Best sets as (score, ranks) pairs, best first, with ranks in candidates' dict order.
+        With first, only sets whose first candidate in search order is masks[first].
+        """
+        seats, masks, steps, top_k = self.seats, self.masks, self.steps, self.top_k
+        shared = self.shared_threshold
+        best = []  # min-heap of the top_k (score, ranks) found so far
+        found = []
+        chosen = []
+        # covered = voters approving at least one chosen candidate,
+        # levels[j] = voters approving exactly j of them
+        covered = 0
+        levels = [0] * (seats + 1)
+
+        def gain(mask, depth):
+            total = steps[0] * (mask & ~covered).bit_count()
+            for j in range(1, depth + 1):
+                total += steps[j] * (mask & levels[j]).bit_count()
+            return total
+
+        def record(score):
+            entry = (score, tuple(self.ranks[i] for i in sorted(chosen, key=self.positions.__getitem__)))
+            if top_k is None:
+                found.append(entry)
+                return
+            if len(best) < top_k:
+                heapq.heappush(best, entry)
+            elif entry > best[0]:
+                heapq.heapreplace(best, entry)
+            if shared is not None and len(best) == top_k and best[0][0] > shared.value:
+                shared.value = best[0][0]
+
+        def threshold():
+            """Sets scoring below this can't make the top_k, or None before any can be ruled out"""
+            if top_k is None:
+                return None
+            local = best[0][0] if len(best) == top_k else None
+            if shared is not None and shared.value >= 0 and (local is None or shared.value > local):
+                return shared.value
+            return local
+
+        def search(start, stop, score):
+            nonlocal covered
+            depth = len(chosen)
+            remaining = seats - depth
+            gains = [gain(masks[i], depth) for i in range(start, len(masks))]
+            # Each child's bound is its gain plus the best remaining - 1 gains after it
+            after = [0] * len(gains)
+            heap = []
+            total = 0
+            for offset in range(len(gains) - 1, -1, -1):
+                after[offset] = total
+                if remaining > 1:
+                    heapq.heappush(heap, gains[offset])
+                    total += gains[offset]
+                    if len(heap) > remaining - 1:
+                        total -= heapq.heappop(heap)
+
+            for offset in range(min(len(gains) - remaining + 1, stop - start)):
+                i = start + offset
+                child_score = score + gains[offset]
+                limit = threshold()
+                if limit is not None and child_score + after[offset] < limit:
+                    continue
+                chosen.append(i)
+                if remaining == 1:
+                    record(child_score)
+                else:
+                    mask = masks[i]
+                    saved_levels, saved_covered = levels[:], covered
+                    for j in range(depth, 0, -1):
+                        moving = levels[j] & mask
+                        levels[j + 1] |= moving
+                        levels[j] &= ~moving
+                    levels[1] |= mask & ~covered
+                    covered |= mask
+                    search(i + 1, len(masks), child_score)
+                    levels[:], covered = saved_levels, saved_covered
+                chosen.pop()
+
+        if first is None:
+            search(0, len(masks), 0)
+        else:
+            search(first, first + 1, 0)
+        return sorted(found if top_k is None else best, reverse=True)
+
+# The CandidateSetSearch a search_candidate_sets worker process was started with
+worker_search = None
+
+def start_search_worker(search, shared_threshold=None):
+    global worker_search
+    search.shared_threshold = shared_threshold
+    worker_search = search
+
+def search_worker(first):
+    return worker_search.run(first)
 
 def votes_by_candidate(poll_id, supabase, candidate_ids=None):
-    if candidate_ids is None:
-        response = supabase.table("PollOptions").select("id").eq("poll", poll_id).execute()
-        candidate_ids = [int(item["id"]) for item in response.data]
-    candidates = {}
-    for candidate_id in candidate_ids:
-        candidates[candidate_id] = set()
-    # get votes
-    for candidate_id in candidate_ids:
-        response = supabase.table("Votes").select("user", "option").eq("poll", poll_id).eq("option", candidate_id).execute()
-        for vote in response.data:
-            candidates[vote["option"]].add(vote["user"])
-    return candidates
+    return PollDatabase(supabase).get_votes_by_candidate(poll_id, candidate_ids)
 
 def votes_by_number_of_candidates(winning_set, candidates):
     # vote overlap counts how many users voted for 1, 2, 3, etc of the candidates in the winning set
     vote_overlap = []
     for c in range(len(winning_set)):
-        vote_overlap.append(set())
         votes = candidates[winning_set[c]]
+        # Empty set of the same kind as the candidates' voters (set or VoterSet)
+        vote_overlap.append(votes - votes)
         for i in range(0,c):
-            promote = vote_overlap[i].intersection(votes)
+            promote = vote_overlap[i] & votes
             vote_overlap[i] = vote_overlap[i] - promote
-            vote_overlap[i+1] = vote_overlap[i+1].union(promote)
+            vote_overlap[i+1] = vote_overlap[i+1] | promote
             votes = votes - promote
-        vote_overlap[0] = vote_overlap[0].union(votes)
+        vote_overlap[0] = vote_overlap[0] | votes
     return vote_overlap
 
-def excess_vote_rounds(seats, candidate_counts, ballot_counts, candidate_text=None):
+def tie_groups(rounds):
+    """
+    Winners in the order they won, grouped by the round that decided them.
+    Candidates tied for the most votes in a round share a group, taken from the
+    rounds' tie_group, so rounds never have to be compared with each other.
+    """
+    groups = []
+    i = 0
+    while i < len(rounds):
+        group = rounds[i].get("tie_group")
+        if group is None:
+            # Only the last round, when no votes are left, has no winner
+            i += 1
+            continue
+        groups.append(list(group))
+        i += len(group)
+    return groups
+
+def votes_needed_table(rounds, candidates, seats):
+    """
+    For every candidate, what it took to win each seat, from the excess vote rounds.
+    Winners are grouped by seat position, with tied winners sharing a position
+    (see tie_groups). Each candidate gets:
+    - votes: its number of approvals
+    - is_winner: whether it won a seat in the rounds
+    - positions: for each position up to `seats`, stopping at the one it won, either
+      {"position", "winners", "won": True, "winner_votes", "with_previous_winners",
+       "without_previous_winners"} (the breakdown is None for the first position) or
+      {"position", "winners", "won": False, "votes_needed", "redistributed", "excluded"}
+    Votes needed are computed from each round's tallies once for all candidates, so
+    looking up a candidate afterwards doesn't recount anything.
+    """
+    winners_in_order = [r["winner"] for r in rounds if r.get("winner")]
+    # A winner's votes in its winning round count every voter who approved it
+    winner_votes = {}
+    for round_data in rounds:
+        winner = round_data.get("winner")
+        if winner and winner in round_data.get("votes_per_candidate", {}):
+            winner_votes[winner] = len(round_data["votes_per_candidate"][winner])
+
+    position_groups = tie_groups(rounds)[:seats]
+
+    # Per position: everyone's tally in the round it was decided, and the voters of the
+    # winners of all earlier positions
+    round_tallies = []
+    previous_voters = []
+    earlier = None
+    for group_idx, group in enumerate(position_groups):
+        tallies = {}
+        if group_idx > 0:
+            for ballot, count in rounds[winners_in_order.index(group[0])].get("ballot_counts", {}).items():
+                for candidate in ballot:
+                    tallies[candidate] = tallies.get(candidate, 0) + count
+        round_tallies.append(tallies)
+        previous_voters.append(earlier)
+        for winner in group:
+            voters = candidates.get(winner, set())
+            earlier = voters if earlier is None else earlier | voters
+
+    table = {}
+    for candidate, voters in candidates.items():
+        votes = len(voters)
+        positions = []
+        excluded = []
+        for group_idx, group in enumerate(position_groups):
+            position = group_idx + 1
+            if candidate in group:
+                entry = {"position": position, "winners": group, "won": True,
+                         "winner_votes": winner_votes.get(candidate, votes),
+                         "with_previous_winners": None, "without_previous_winners": None}
+                if position > 1:
+                    with_previous = len(voters & previous_voters[group_idx]) if previous_voters[group_idx] is not None else 0
+                    entry["with_previous_winners"] = with_previous
+                    entry["without_previous_winners"] = votes - with_previous
+                positions.append(entry)
+                break
+
+            excluded = excluded + group
+            if group_idx == 0:
+                # +1 to beat, not tie
+                votes_needed = winner_votes[group[0]] - votes + 1
+            else:
+                tallies = round_tallies[group_idx]
+                # Round up to whole voters; +0.01 to beat, not just tie
+                votes_needed = math.ceil(tallies.get(group[0], 0) - tallies.get(candidate, 0) + 0.01)
+            positions.append({"position": position, "winners": group, "won": False,
+                              "votes_needed": votes_needed, "redistributed": group_idx > 0,
+                              "excluded": group if group_idx == 0 else excluded})
+        table[candidate] = {"votes": votes, "is_winner": candidate in winners_in_order, "positions": positions}
+    return table
+
+class RoundTrace:
+    """
+    Records what the excess vote method did in each round, for debugging a poll's results.
+    Pass one to a tally engine as trace=...; with trace=None the engines skip all of this.
+    Events keep candidate IDs and numbers as they are, and nothing is formatted until
+    to_dict or lines is called.
+    """
+    def __init__(self):
+        self.events = []
+
+    def start(self, seats, ballot_counts):
+        self.events.append({"event": "start", "seats": seats, "ballot_counts": dict(ballot_counts)})
+
+    def round(self, number, vote_counts):
+        self.events.append({"event": "round", "round": number, "vote_counts": dict(vote_counts)})
+
+    def winners(self, number, winners, max_votes):
+        self.events.append({"event": "winners", "round": number, "winners": list(winners), "max_votes": max_votes})
+
+    def redistribute(self, number, threshold, excess, transfers):
+        """transfers is a list of (ballot, remaining_ballot, votes_moved), remaining_ballot is None if emptied"""
+        self.events.append({"event": "redistribute", "round": number, "threshold": threshold,
+                            "excess": excess, "transfers": list(transfers)})
+
+    def end(self, rounds):
+        self.events.append({"event": "end", "winners": [r["winner"] for r in rounds if "winner" in r]})
+
+    def to_dict(self):
+        """JSON-serializable form of the events, with ballots as sorted lists of candidate IDs"""
+        def ballot(b):
+            return sorted(b) if b is not None else None
+
+        events = []
+        for event in self.events:
+            event = dict(event)
+            if "ballot_counts" in event:
+                event["ballot_counts"] = [{"ballot": ballot(b), "count": count} for b, count in event["ballot_counts"].items()]
+            if "vote_counts" in event:
+                event["vote_counts"] = {str(c): votes for c, votes in event["vote_counts"].items()}
+            if "transfers" in event:
+                event["transfers"] = [{"from": ballot(b), "to": ballot(to), "votes": votes} for b, to, votes in event["transfers"]]
+            events.append(event)
+        return {"events": events}
+
+    def lines(self, candidate_text=None):
+        """Human-readable trace, one line per entry"""
+        def name(c):
+            return candidate_text.get(c, f"ID {c}") if candidate_text else str(c)
+
+        def ballot(b):
+            return "[" + ", ".join(name(c) for c in sorted(b)) + "]" if b else "[]"
+
+        lines = []
+        for event in self.events:
+            kind = event["event"]
+            if kind == "start":
+                counts = event["ballot_counts"]
+                lines.append(f"seats: {event['seats']}, unique ballots: {len(counts)}, total votes: {sum(counts.values())}")
+                for b, count in sorted(counts.items(), key=lambda x: x[1], reverse=True):
+                    lines.append(f"  {ballot(b)}: {count} vote{'s' if count != 1 else ''}")
+            elif kind == "round":
+                lines.append(f"=== ROUND {event['round']} ===")
+                for c, votes in sorted(event["vote_counts"].items(), key=lambda x: x[1], reverse=True):
+                    lines.append(f"  {name(c)}: {votes:.2f} votes")
+            elif kind == "winners":
+                lines.append(f"Winner{'s' if len(event['winners']) > 1 else ''} with {event['max_votes']:.2f} votes: {', '.join(name(c) for c in event['winners'])}")
+            elif kind == "redistribute":
+                lines.append(f"Redistributing {event['excess']:.2f} excess votes (runner-up has {event['threshold']:.2f})")
+                for b, to, votes in event["transfers"]:
+                    if to is not None:
+                        lines.append(f"  {votes:.2f} votes from {ballot(b)} to {ballot(to)}")
+            elif kind == "end":
+                lines.append(f"Winners in order: {', '.join(name(c) for c in event['winners'])}")
+        return lines
+
+def excess_vote_rounds(seats, candidate_counts, ballot_counts, candidate_text=None, trace=None):
     """
     Calculate winners using excess vote method.
     
@@ -158,37 +513,14 @@ def excess_vote_rounds(seats, candidate_counts, ballot_counts, candidate_text=No
         ballot_counts: Dictionary where keys are frozensets of candidate IDs 
                       and values are the count of voters who cast that ballot
         candidate_text: Optional dictionary mapping candidate IDs to names for display
+        trace: Optional RoundTrace that records each round for debugging
     """
-    print("\n=== DEBUG: excess_vote_rounds called ===")
-    print(f"seats: {seats}")
-    print(f"ballot_counts type: {type(ballot_counts)}")
-    print(f"Number of unique ballots: {len(ballot_counts)}")
-    print(f"Total votes: {sum(ballot_counts.values())}")
-    
-    print("\n=== Ballot Combinations ===")
-    for ballot, count in sorted(ballot_counts.items(), key=lambda x: x[1], reverse=True):
-        if candidate_text:
-            candidates_str = ", ".join([candidate_text.get(c, f"ID {c}") for c in sorted(ballot)])
-        else:
-            candidates_str = ", ".join([f"{c}" for c in sorted(ballot)])
-        print(f"  [{candidates_str}]: {count} vote{'s' if count != 1 else ''}")
-    
-    # Get all unique candidates from all ballots
-    all_candidates = set()
-    for ballot in ballot_counts.keys():
-        all_candidates.update(ballot)
-    print(f"\nAll candidates in race: {sorted(all_candidates)}")
-    print(f"Candidate counts: {candidate_counts}")
-    print("=== END DEBUG ===\n")
-
-    rounds = []
+    if trace is not None:
+        trace.start(seats, ballot_counts)
+
+    rounds = RoundHistory(ballot_counts, candidate_counts)
     i = 0
     while i < seats:
-        print(f"\n=== ROUND {i+1} ===")
-        rounds.append({})
-        rounds[i]["ballot_counts"] = ballot_counts.copy()
-        rounds[i]["votes_per_candidate"] = candidate_counts.copy()
-
         # Calculate vote counts from ballot_counts (handles fractional votes)
         vote_counts = {}
         for ballot, count in ballot_counts.items():
@@ -197,28 +529,20 @@ def excess_vote_rounds(seats, candidate_counts, ballot_counts, candidate_text=No
                     vote_counts[candidate] = 0
                 vote_counts[candidate] += count
         
-        print(f"Vote counts this round:")
-        for cand, votes in sorted(vote_counts.items(), key=lambda x: x[1], reverse=True):
-            print(f"  Candidate {cand}: {votes:.2f} votes")
-        print(f"Total ballots in play: {sum(ballot_counts.values()):.2f}")
-        
+        if trace is not None:
+            trace.round(i + 1, vote_counts)
+
         # Handle case where no votes have been cast
         if not vote_counts:
-            print("No votes cast yet")
+            rounds.add_rounds([], None)
             break
         
         max_votes = max(vote_counts.values())
         # Get all candidates with max votes (handles ties)
         winners_with_max = [cand for cand, votes in vote_counts.items() if votes == max_votes]
-        print(f"Winners with max votes: {winners_with_max}")
-        for j in range(len(winners_with_max)):
-            if j > 0:
-                rounds.append({})
-            rounds[i + j]["winner"] = winners_with_max[j]
-            rounds[i + j]["is_tie"] = True
-            rounds[i + j]["ballot_counts"] = ballot_counts.copy()
-            rounds[i + j]["votes_per_candidate"] = candidate_counts.copy()
-        print(f"i + len(winners_with_max): {i + len(winners_with_max)}, seats: {seats}")
+        if trace is not None:
+            trace.winners(i + 1, winners_with_max, max_votes)
+        rounds.add_rounds(winners_with_max, max_votes)
         if i + len(winners_with_max) < seats:
             # Find the runner-up vote count (accounting for ties)
             # Remove winners from consideration
@@ -237,8 +561,9 @@ def excess_vote_rounds(seats, candidate_counts, ballot_counts, candidate_text=No
                 if any(winner in ballot for winner in winners_with_max):
                     ballots_with_winners[ballot] = count
             
-            winner_votes = len(winners_with_max) * max_votes
             excess_fraction = {}
+            changed_ballots = []
+            transfers = [] if trace is not None else None
             
             # remove candidate sets that include any of the winners from ballot_counts
             new_ballot_counts = {}
@@ -249,12 +574,8 @@ def excess_vote_rounds(seats, candidate_counts, ballot_counts, candidate_text=No
             
             # Update ballot_counts for the next round
             ballot_counts = new_ballot_counts
-            print(f"ballot_counts before adding excess votes: {ballot_counts}")
-            print(f"\nBallots containing winner(s) {winners_with_max}:")
             total_votes_with_winners = sum(ballots_with_winners.values())
             for ballot, count in sorted(ballots_with_winners.items(), key=lambda x: x[1], reverse=True):
-                ballot_str = ", ".join([str(c) for c in sorted(ballot)])
-                print(f"  [{ballot_str}]: {count} votes")
                 excess_fraction[ballot] = count / total_votes_with_winners
                 
                 # for this candidate set, remove the winners, and add excess * excess_fraction to the resulting candidate set, in ballot_counts
@@ -272,30 +593,305 @@ def excess_vote_rounds(seats, candidate_counts, ballot_counts, candidate_text=No
                         ballot_counts[remaining_ballot] += votes_to_add
                     else:
                         ballot_counts[remaining_ballot] = votes_to_add
-                    
-                    print(f"    Redistributing {votes_to_add:.2f} votes from [{ballot_str}] to [{', '.join(str(c) for c in sorted(remaining_candidates))}]")
-            print(f"ballot_counts after adding excess votes: {ballot_counts}")
-            print(f"  Total votes for winner(s): {total_votes_with_winners}")
-            print(f"  Excess fraction: {excess_fraction}")
-            
-            # Show updated ballot counts after redistribution
-            print(f"\nUpdated ballot counts after redistribution:")
-            for ballot, count in sorted(ballot_counts.items(), key=lambda x: x[1], reverse=True):
-                ballot_str = ", ".join([str(c) for c in sorted(ballot)])
-                print(f"  [{ballot_str}]: {count:.2f} votes")
-            print(f"Total ballots after redistribution: {sum(ballot_counts.values()):.2f}")
+                    changed_ballots.append(remaining_ballot)
+                    if transfers is not None:
+                        transfers.append((ballot, remaining_ballot, votes_to_add))
+                elif transfers is not None:
+                    transfers.append((ballot, None, 0))
+            if trace is not None:
+                trace.redistribute(i + 1, threshold, excess, transfers)
             
             # Remove winners from candidate_counts for next round
             for winner in winners_with_max:
                 if winner in candidate_counts:
                     del candidate_counts[winner]
-        print(f"i: {i}, len(winners_with_max): {len(winners_with_max)}")
+            rounds.advance(ballots_with_winners, {ballot: ballot_counts[ballot] for ballot in changed_ballots}, winners_with_max)
         i = i + len(winners_with_max)
     
-    print(f"\n=== FINAL RESULTS ===")
-    print(f"Winners selected across {len(rounds)} rounds:")
-    for idx, round_data in enumerate(rounds):
-        if "winner" in round_data:
-            print(f"  Round {idx+1}: Candidate {round_data['winner']}")
-    
-    return rounds
\ No newline at end of file
+    if trace is not None:
+        trace.end(rounds)
+    return rounds
+
+def excess_vote_rounds_bitmask(seats, candidate_counts, ballot_counts, candidate_text=None, trace=None):
+    """
+    Same rounds as excess_vote_rounds, computed with ballots held as integer bitmasks.
+    Each candidate ID gets a bit, so checking a ballot for winners, removing winners
+    and counting votes per candidate are bitwise operations on ints instead of
+    frozenset rebuilds and membership scans. Frozensets are only built for ballots
+    created by redistribution, to record them in the round history.
+    """
+    bits = {}
+    for ballot in ballot_counts:
+        for candidate in ballot:
+            if candidate not in bits:
+                bits[candidate] = 1 << len(bits)
+    candidate_for_bit = {bit: candidate for candidate, bit in bits.items()}
+
+    # mask -> the frozenset used as that ballot's key, and mask -> bits set in it
+    ballot_sets = {}
+    mask_bits = {}
+    weights = {}
+    for ballot, count in ballot_counts.items():
+        mask = 0
+        for candidate in ballot:
+            mask |= bits[candidate]
+        ballot_sets[mask] = ballot
+        weights[mask] = count
+
+    def set_bits(mask):
+        if mask not in mask_bits:
+            mask_bits[mask] = tuple(1 << position for position in range(mask.bit_length()) if mask >> position & 1)
+        return mask_bits[mask]
+
+    if trace is not None:
+        trace.start(seats, ballot_counts)
+
+    rounds = RoundHistory(ballot_counts, candidate_counts)
+    i = 0
+    while i < seats:
+        # Calculate vote counts per candidate bit (handles fractional votes)
+        vote_counts = {}
+        for mask, count in weights.items():
+            for bit in set_bits(mask):
+                if bit not in vote_counts:
+                    vote_counts[bit] = 0
+                vote_counts[bit] += count
+
+        if trace is not None:
+            trace.round(i + 1, {candidate_for_bit[bit]: votes for bit, votes in vote_counts.items()})
+
+        # Handle case where no votes have been cast
+        if not vote_counts:
+            rounds.add_rounds([], None)
+            break
+
+        max_votes = max(vote_counts.values())
+        winners_mask = 0
+        for bit, votes in vote_counts.items():
+            if votes == max_votes:
+                winners_mask |= bit
+        if winners_mask & (winners_mask - 1):
+            # Tied winners are listed in the order they first appear on a ballot,
+            # which is the order excess_vote_rounds finds them in
+            winners_with_max = []
+            for mask in weights:
+                if mask & winners_mask:
+                    for candidate in ballot_sets[mask]:
+                        if bits[candidate] & winners_mask and candidate not in winners_with_max:
+                            winners_with_max.append(candidate)
+        else:
+            winners_with_max = [candidate_for_bit[winners_mask]]
+        if trace is not None:
+            trace.winners(i + 1, winners_with_max, max_votes)
+
+        rounds.add_rounds(winners_with_max, max_votes)
+
+        if i + len(winners_with_max) < seats:
+            threshold = max(votes for bit, votes in vote_counts.items() if not bit & winners_mask)
+            excess = max_votes - threshold
+
+            # Split ballots into those with and without a winner
+            ballots_with_winners = []
+            new_weights = {}
+            for mask, count in weights.items():
+                if mask & winners_mask:
+                    ballots_with_winners.append((mask, count))
+                else:
+                    new_weights[mask] = count
+            weights = new_weights
+
+            # Redistribute the excess to each ballot's remaining candidates
+            winners_set = set(winners_with_max)
+            changed = []
+            transfers = [] if trace is not None else None
+            total_votes_with_winners = sum(count for mask, count in ballots_with_winners)
+            for mask, count in sorted(ballots_with_winners, key=lambda x: x[1], reverse=True):
+                remaining = mask & ~winners_mask
+                if remaining:
+                    votes_to_add = excess * (count / total_votes_with_winners)
+                    if remaining in weights:
+                        weights[remaining] += votes_to_add
+                    else:
+                        ballot_sets[remaining] = frozenset(ballot_sets[mask] - winners_set)
+                        weights[remaining] = votes_to_add
+                    changed.append(remaining)
+                    if transfers is not None:
+                        transfers.append((ballot_sets[mask], ballot_sets[remaining], votes_to_add))
+                elif transfers is not None:
+                    transfers.append((ballot_sets[mask], None, 0))
+            if trace is not None:
+                trace.redistribute(i + 1, threshold, excess, transfers)
+
+            # Remove winners from candidate_counts for next round
+            for winner in winners_with_max:
+                if winner in candidate_counts:
+                    del candidate_counts[winner]
+            rounds.advance([ballot_sets[mask] for mask, count in ballots_with_winners],
+                           {ballot_sets[mask]: weights[mask] for mask in changed}, winners_with_max)
+        i = i + len(winners_with_max)
+
+    if trace is not None:
+        trace.end(rounds)
+    return rounds
+
+
+def row_keys(approvals):
+    """Pack each row of a boolean matrix into uint64 words, 1-D when there are at most 64 columns"""
+    packed = np.packbits(approvals, axis=1)
+    padding = -packed.shape[1] % 8
+    if padding:
+        packed = np.pad(packed, ((0, 0), (0, padding)))
+    words = np.ascontiguousarray(packed).view(np.uint64)
+    return words[:, 0] if words.shape[1] == 1 else words
+
+def excess_vote_rounds_numpy(seats, candidate_counts, ballot_counts, candidate_text=None, trace=None):
+    """
+    Vectorized excess_vote_rounds for large polls. Requires numpy.
+    Distinct ballots are rows of a boolean (ballots x candidates) matrix with a weight
+    vector, so each round's vote counts are one matrix-vector product and removing and
+    redistributing winners' ballots is array arithmetic. Rows stay in the same order as
+    the other engines' ballot_counts, so winners and ties come out in the same order.
+    Fractional tallies can differ from the other engines by float rounding, so ties are
+    detected with a relative tolerance of TIE_TOLERANCE.
+    """
+    if np is None:
+        raise ImportError("excess_vote_rounds_numpy requires numpy")
+
+    columns = {}
+    for ballot in ballot_counts:
+        for candidate in ballot:
+            if candidate not in columns:
+                columns[candidate] = len(columns)
+    column_candidates = list(columns)
+
+    row_sets = list(ballot_counts.keys())
+    approvals = np.zeros((len(row_sets), len(columns)), dtype=bool)
+    for row, ballot in enumerate(row_sets):
+        approvals[row, [columns[candidate] for candidate in ballot]] = True
+    weights = np.array(list(ballot_counts.values()), dtype=np.float64)
+    # Ballots that have received redistributed votes; the rest keep integer counts
+    fractional = np.array([not isinstance(count, int) for count in ballot_counts.values()], dtype=bool)
+
+    if trace is not None:
+        trace.start(seats, ballot_counts)
+
+    rounds = RoundHistory(ballot_counts, candidate_counts)
+    i = 0
+    while i < seats:
+        present = approvals.any(axis=0)
+        vote_counts = weights @ approvals
+        if trace is not None:
+            trace.round(i + 1, {column_candidates[column]: votes for column, votes in enumerate(vote_counts.tolist()) if present[column]})
+
+        # Handle case where no votes have been cast
+        if not present.any():
+            rounds.add_rounds([], None)
+            break
+
+        max_votes = vote_counts[present].max()
+        is_winner = present & (vote_counts >= max_votes - TIE_TOLERANCE * max(abs(max_votes), 1))
+        winner_columns = np.flatnonzero(is_winner)
+        if len(winner_columns) > 1:
+            # List tied winners in the order they first appear on a ballot
+            order = []
+            for column in winner_columns:
+                first_row = int(np.argmax(approvals[:, column]))
+                position = list(row_sets[first_row]).index(column_candidates[column])
+                order.append((first_row, position, column_candidates[column]))
+            winners_with_max = [candidate for _, _, candidate in sorted(order)]
+        else:
+            winners_with_max = [column_candidates[winner_columns[0]]]
+        # Report the tally as an int while no ballot has fractional weight, like the other engines
+        winner_tally = float(max_votes) if fractional.any() else int(max_votes)
+        if trace is not None:
+            trace.winners(i + 1, winners_with_max, winner_tally)
+
+        rounds.add_rounds(winners_with_max, winner_tally)
+
+        if i + len(winners_with_max) < seats:
+            threshold = vote_counts[present & ~is_winner].max()
+            excess = float(max_votes) - float(threshold)
+
+            has_winner = approvals[:, is_winner].any(axis=1)
+            keep = np.flatnonzero(~has_winner)
+            # Redistribute in descending weight order, like the other engines
+            moved = np.flatnonzero(has_winner)
+            moved = moved[np.argsort(-weights[moved], kind="stable")]
+            total_votes_with_winners = weights[has_winner].sum()
+
+            moved_approvals = approvals[moved] & ~is_winner
+            nonempty = moved_approvals.any(axis=1)
+            moved = moved[nonempty]
+            moved_approvals = moved_approvals[nonempty]
+            votes_to_add = excess * (weights[moved] / total_votes_with_winners)
+            if trace is not None:
+                winners_set = set(winners_with_max)
+                transfers = [(row_sets[row], frozenset(row_sets[row] - winners_set), votes)
+                             for row, votes in zip(moved.tolist(), votes_to_add.tolist())]
+                trace.redistribute(i + 1, float(threshold), excess, transfers)
+
+            # Merge ballots that become identical once winners are removed
+            combined = np.vstack([approvals[keep], moved_approvals])
+            combined_weights = np.concatenate([weights[keep], votes_to_add])
+            _, first_index, inverse = np.unique(row_keys(combined), axis=0, return_index=True, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            # Number unique rows by first appearance so the row order matches ballot_counts
+            rank = np.empty(len(first_index), dtype=np.intp)
+            rank[np.argsort(first_index, kind="stable")] = np.arange(len(first_index))
+            target = rank[inverse]
+            new_weights = np.zeros(len(first_index), dtype=np.float64)
+            np.add.at(new_weights, target, combined_weights)
+            new_fractional = np.zeros(len(first_index), dtype=bool)
+            new_fractional[target[:len(keep)]] = fractional[keep]
+            new_fractional[target[len(keep):]] = True
+
+            winners_set = set(winners_with_max)
+            sources = np.sort(first_index)
+            keep_rows, moved_rows = keep.tolist(), moved.tolist()
+            new_row_sets = []
+            for source in sources.tolist():
+                if source < len(keep_rows):
+                    new_row_sets.append(row_sets[keep_rows[source]])
+                else:
+                    new_row_sets.append(frozenset(row_sets[moved_rows[source - len(keep_rows)]] - winners_set))
+
+            received = np.zeros(len(first_index), dtype=bool)
+            received[target[len(keep):]] = True
+            new_values = new_weights.tolist()
+            changed = {new_row_sets[row]: new_values[row] for row in np.flatnonzero(received).tolist()}
+            removed = [row_sets[row] for row in np.flatnonzero(has_winner).tolist()]
+
+            approvals = combined[sources]
+            weights = new_weights
+            fractional = new_fractional
+            row_sets = new_row_sets
+
+            # Remove winners from candidate_counts for next round
+            for winner in winners_with_max:
+                if winner in candidate_counts:
+                    del candidate_counts[winner]
+            rounds.advance(removed, changed, winners_with_max)
+        i = i + len(winners_with_max)
+
+    if trace is not None:
+        trace.end(rounds)
+    return rounds
+
+# Relative difference below which the numpy engine treats two tallies as tied
+TIE_TOLERANCE = 1e-9
+
+TALLY_ENGINES = {
+    "sets": excess_vote_rounds,
+    "bitmask": excess_vote_rounds_bitmask,
+}
+if np is not None:
+    TALLY_ENGINES["numpy"] = excess_vote_rounds_numpy
+
+def get_tally_engine(name):
+    """
+    Look up an excess vote method implementation by name ("sets", "bitmask" or "numpy").
+    All share excess_vote_rounds' signature. Falls back to the bitmask engine if the
+    requested one is unavailable, e.g. "numpy" without numpy installed.
+    """
+    return TALLY_ENGINES.get(name, excess_vote_rounds_bitmask)
+
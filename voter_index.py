@@ -0,0 +1,144 @@
+from collections.abc import Set
+
+class VoterIndex:
+    """
+    Numbers a poll's voters (user IDs) 0, 1, 2, ... so that a set of voters can be
+    stored as a VoterSet: one bit per voter in a Python int instead of a set of IDs.
+    """
+    def __init__(self, users=()):
+        self.rows = {}
+        self.users = []
+        for user in users:
+            self.row(user)
+
+    def row(self, user):
+        """The user's row number, adding the user if they are new"""
+        row = self.rows.get(user)
+        if row is None:
+            row = self.rows[user] = len(self.users)
+            self.users.append(user)
+        return row
+
+    def __len__(self):
+        return len(self.users)
+
+    def add_anonymous(self, count):
+        """Add count voters known only by their row number; returns the first new row"""
+        start = len(self.users)
+        self.users.extend(range(start, start + count))
+        return start
+
+    def voter_set(self, users=()):
+        return self.from_rows([self.row(user) for user in users])
+
+    def from_rows(self, rows):
+        """VoterSet of the given row numbers, built in one pass rather than one bit at a time"""
+        rows = list(rows)
+        if not rows:
+            return VoterSet(self, 0)
+        buffer = bytearray(max(rows) // 8 + 1)
+        for row in rows:
+            buffer[row >> 3] |= 1 << (row & 7)
+        return VoterSet(self, int.from_bytes(buffer, "little"))
+
+    def from_runs(self, runs):
+        """VoterSet from (included, count) runs that cover rows 0, 1, 2, ... in order"""
+        # The first row is the lowest bit, so the runs are written out last to first
+        text = "".join(reversed(["1" * count if included else "0" * count for included, count in runs]))
+        return VoterSet(self, int(text, 2) if text else 0)
+
+class VoterSet(Set):
+    """
+    Immutable set of voters from one VoterIndex, stored as a bitmap (bit n = row n).
+    Behaves like a frozenset of user IDs and compares equal to one with the same users.
+    Between VoterSets of the same index, &, |, - and ^ are single int operations and
+    len is a popcount, so overlaps between candidates' voters don't touch each voter.
+    """
+    __slots__ = ("index", "bits")
+
+    def __init__(self, index, bits=0):
+        self.index = index
+        self.bits = bits
+
+    def _from_iterable(self, iterable):
+        return self.index.voter_set(iterable)
+
+    def rows(self):
+        """Row numbers of the voters in the set, ascending"""
+        text = format(self.bits, "b")[::-1]
+        row = text.find("1")
+        while row != -1:
+            yield row
+            row = text.find("1", row + 1)
+
+    def __iter__(self):
+        users = self.index.users
+        for row in self.rows():
+            yield users[row]
+
+    def __len__(self):
+        return self.bits.bit_count()
+
+    def __contains__(self, user):
+        row = self.index.rows.get(user)
+        return row is not None and (self.bits >> row) & 1 == 1
+
+    def same_index(self, other):
+        return isinstance(other, VoterSet) and other.index is self.index
+
+    def __and__(self, other):
+        if self.same_index(other):
+            return VoterSet(self.index, self.bits & other.bits)
+        return Set.__and__(self, other)
+
+    def __or__(self, other):
+        if self.same_index(other):
+            return VoterSet(self.index, self.bits | other.bits)
+        return Set.__or__(self, other)
+
+    def __sub__(self, other):
+        if self.same_index(other):
+            return VoterSet(self.index, self.bits & ~other.bits)
+        return Set.__sub__(self, other)
+
+    def __xor__(self, other):
+        if self.same_index(other):
+            return VoterSet(self.index, self.bits ^ other.bits)
+        return Set.__xor__(self, other)
+
+    __rand__ = __and__
+    __ror__ = __or__
+    __rxor__ = __xor__
+
+    def __rsub__(self, other):
+        if self.same_index(other):
+            return VoterSet(self.index, other.bits & ~self.bits)
+        return Set.__rsub__(self, other)
+
+    def __eq__(self, other):
+        if self.same_index(other):
+            return self.bits == other.bits
+        return Set.__eq__(self, other)
+
+    __hash__ = None
+
+    def isdisjoint(self, other):
+        if self.same_index(other):
+            return not self.bits & other.bits
+        return Set.isdisjoint(self, other)
+
+    # frozenset's method names, for code written against sets
+    def intersection(self, other):
+        return self & (other if isinstance(other, Set) else set(other))
+
+    def union(self, other):
+        return self | (other if isinstance(other, Set) else set(other))
+
+    def difference(self, other):
+        return self - (other if isinstance(other, Set) else set(other))
+
+    def copy(self):
+        return self
+
+    def __repr__(self):
+        return f"VoterSet({set(self)!r})"
@@ -1,26 +1,102 @@
-from flask import Flask, render_template, request, session, make_response, redirect, Response
+from flask import Flask, render_template, request, session, make_response, redirect, Response, g
 from supabase import create_client, Client
+from werkzeug.http import is_resource_modified
 import itertools
 import traceback
 import csv
+import hashlib
 import io
 import json
-import math
-from datetime import datetime
-from database import PollDatabase
+import os
+from datetime import datetime, timezone
+try:
+    import orjson
+except ImportError:  # fall back to the standard library for serializing results
+    orjson = None
+from database import PollDatabase, PollSnapshot
+from cache import ResultsCache, SharedVersions, SingleFlight, private_dir
 from email_service import EmailService
-from vote_utils import format_vote_confirmation, format_winners_text, sorted_candidate_sets, excess_vote_rounds, votes_by_candidate, votes_by_number_of_candidates
+from vote_utils import format_vote_confirmation, format_winners_text, sorted_candidate_sets, get_tally_engine, TALLY_ENGINES, RoundTrace, tie_groups, votes_needed_table, votes_by_candidate, votes_by_number_of_candidates
 import secret_constants
 from constants import EMAIL, TITLE, COVER_URL, DESCRIPTION, CANDIDATES, SEATS, NEW_POLL, NEW_VOTE, LOGIN, EMAIL_VERIFICATION, SELECTED, ID, VERIFICATION_CODE
+from constants import BALLOT_EMAIL_REQUIRED, BALLOT_UNKNOWN_USER, BALLOT_VERIFICATION_REQUIRED
+from constants import RESULTS_CACHE_SIZE, RESULTS_CACHE_TTL, RESULTS_CACHE_STALE_BUDGET, RESULTS_LOCK_DIR, TALLY_ENGINE
+from constants import POLL_PAGE_MAX_AGE, DASHBOARD_PAGE_SIZE
 
 app = Flask(__name__)
 app.secret_key = secret_constants.FLASK_SECRET
+# Round traces of the tally are served at /api/results/<poll_id>/trace in development,
+# or anywhere with RESULTS_TRACE=1 set in the environment
+app.config["RESULTS_TRACE"] = os.getenv("RESULTS_TRACE") == "1"
+
+def shared_results_dir():
+    """RESULTS_LOCK_DIR if it is private to this user, else None: workers then only coordinate within themselves"""
+    try:
+        return private_dir(RESULTS_LOCK_DIR)
+    except OSError:
+        print(traceback.format_exc())
+        return None
 
 # Initialize services
 supabase: Client = create_client(secret_constants.DB_URL, secret_constants.DB_SERVICE_ROLE_KEY)
-db = PollDatabase(supabase)
+results_dir = shared_results_dir()
+results_cache = ResultsCache(RESULTS_CACHE_SIZE, RESULTS_CACHE_TTL, RESULTS_CACHE_STALE_BUDGET,
+                             versions=SharedVersions(results_dir) if results_dir else None)
+# Shares the rows each results computation reads from the database between worker processes
+ballot_loads = SingleFlight(results_dir)
+db = PollDatabase(supabase, results_cache)
 email_service = EmailService(secret_constants.NOREPLY_EMAIL, secret_constants.NOREPLY_PASSWORD)
 
+def template_version():
+    """Digest of the templates, so that pages cached by ETag are re-sent after a deploy changes them"""
+    digest = hashlib.sha1()
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    for root, dirs, files in os.walk(template_dir):
+        dirs.sort()
+        for name in sorted(files):
+            with open(os.path.join(root, name), "rb") as f:
+                digest.update(name.encode())
+                digest.update(f.read())
+    return digest.hexdigest()
+
+TEMPLATE_VERSION = template_version()
+
+def content_tag(*parts):
+    """ETag for a page rendered from the given JSON-serializable data"""
+    data = json.dumps([TEMPLATE_VERSION, *parts], sort_keys=True, default=str)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+def parse_timestamp(timestamp):
+    """Supabase timestamp string as a datetime, or None if missing or unparseable"""
+    try:
+        return datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return None
+
+def conditional_response(etag, render, last_modified=None, cache_control="no-cache"):
+    """
+    Answer a GET for content identified by etag (and last_modified, if known).
+    Returns 304 Not Modified when the client's If-None-Match / If-Modified-Since
+    show its copy is current, so the page isn't rendered or sent again; otherwise
+    the response from render(). Either way the validators and Cache-Control are set.
+    """
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = make_response(render())
+    else:
+        response = Response(status=304)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+def lookup_user_id(email):
+    """db.get_user_id, remembered for the rest of the request, including for unknown emails"""
+    user_ids = g.setdefault("user_ids", {})
+    if email not in user_ids:
+        user_ids[email] = db.get_user_id(email)
+    return user_ids[email]
+
 @app.route("/")
 def home_page():
     return render_template('home.html.j2')
@@ -38,13 +114,19 @@ def poll_page(poll_id):
         description = poll_details['description'] or "Vote on this poll!"
         thumbnail_url = poll_details['cover_photo'] or ""
         candidates = db.get_poll_candidates(poll_id)
-        return render_template('poll.html.j2', 
+        # The poll can't be edited after creation, so its definition identifies the page
+        return conditional_response(
+            content_tag(poll_id, poll_details, candidates),
+            lambda: render_template('poll.html.j2', 
                             seats=seats, 
                             candidates=candidates, 
                             poll_id=poll_id, 
                             page_title=title, 
                             page_description=description, 
-                            thumbnail_url=thumbnail_url)
+                            thumbnail_url=thumbnail_url),
+            last_modified=parse_timestamp(poll_details.get('created_at')),
+            cache_control=f"public, max-age={POLL_PAGE_MAX_AGE}"
+        )
     except Exception as err:
         print(traceback.format_exc())
         return f"Error loading poll: {type(err).__name__}. Please check if the poll ID is correct.", 404
@@ -66,9 +148,11 @@ def new_vote(form_data=None):
         return response
 
     try:
-        # Check if email verification is required
-        email_verification = db.get_poll_email_verification(poll_data[ID])
-        if email_verification and not poll_data[EMAIL]:
+        # Resolve the voter and save the ballot in one round trip
+        verified = EMAIL in session and session[EMAIL] == poll_data[EMAIL]
+        result = db.submit_ballot(poll_data[ID], poll_data[EMAIL], poll_data[SELECTED], verified=verified)
+
+        if result["status"] == BALLOT_EMAIL_REQUIRED:
             response = make_response(f"""
             <p class="text-red-600 font-medium">Please enter an email address.</p>
             """)
@@ -77,35 +161,30 @@ def new_vote(form_data=None):
             return response
 
         # Handle user verification
-        if poll_data[EMAIL]:
-            if not db.user_exists(poll_data[EMAIL]):
-                db.save_form_data(poll_data)
-                response = make_response(render_template(
-                    "new_user_snippet.html.j2", 
-                    email=poll_data[EMAIL], 
-                    origin_function=NEW_VOTE
-                ))
-                response.headers["HX-Retarget"] = "#error-message-div"
-                response.headers["HX-Swap"] = "innerHTML"
-                return response
+        if result["status"] == BALLOT_UNKNOWN_USER:
+            db.save_form_data(poll_data)
+            response = make_response(render_template(
+                "new_user_snippet.html.j2", 
+                email=poll_data[EMAIL], 
+                origin_function=NEW_VOTE
+            ))
+            response.headers["HX-Retarget"] = "#error-message-div"
+            response.headers["HX-Swap"] = "innerHTML"
+            return response
 
-            if email_verification and (EMAIL not in session or session[EMAIL] != poll_data[EMAIL]):
-                db.save_form_data(poll_data)
-                code = email_service.send_verification_email(poll_data[EMAIL])
-                session[VERIFICATION_CODE] = code
-                response = make_response(render_template(
-                    "verification_code_snippet.html.j2",
-                    user_id=db.get_user_id(poll_data[EMAIL]),
-                    origin_function=NEW_VOTE
-                ))
-                response.headers["HX-Retarget"] = "#error-message-div"
-                response.headers["HX-Swap"] = "innerHTML"
-                return response
+        if result["status"] == BALLOT_VERIFICATION_REQUIRED:
+            db.save_form_data(poll_data)
+            code = email_service.send_verification_email(poll_data[EMAIL])
+            session[VERIFICATION_CODE] = code
+            response = make_response(render_template(
+                "verification_code_snippet.html.j2",
+                user_id=result["user_id"],
+                origin_function=NEW_VOTE
+            ))
+            response.headers["HX-Retarget"] = "#error-message-div"
+            response.headers["HX-Swap"] = "innerHTML"
+            return response
 
-        # Process the vote
-        user_id = db.get_user_id(poll_data[EMAIL]) if poll_data[EMAIL] else db.create_anonymous_user()
-        db.save_votes(poll_data[ID], user_id, poll_data[SELECTED])
-        
         response = make_response(format_vote_confirmation(poll_data[SELECTED], poll_data[ID]))
         response.headers["HX-Retarget"] = "#error-message-div"
         response.headers["HX-Swap"] = "innerHTML"
@@ -115,27 +194,143 @@ def new_vote(form_data=None):
         print(traceback.format_exc())
         return type(err).__name__
 
+def dump_json(data):
+    """Serialize to compact JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode()
+
+EMPTY_ROUNDS_JSON = dump_json({"candidates": [], "approvals": [], "ballots": [], "initial": [], "steps": [], "rounds": []})
+
+def load_poll_ballots(poll_id):
+    """
+    db.get_poll_ballots, with the database read shared between worker processes: a worker
+    that waited while another read the same poll at the same vote version reuses its rows
+    """
+    version = results_cache.version(poll_id)
+    rows = ballot_loads.do((poll_id, version), lambda: db.get_poll_ballot_rows(poll_id),
+                           shared_key=f"poll-{poll_id}", shared_version=version)
+    return PollSnapshot.from_ballots(poll_id, rows["options"], rows["ballots"])
+
+def compute_poll_results(poll_id):
+    """
+    Load a poll's votes and run the excess vote method.
+    Returns everything the results page and candidate comparison need to render.
+    Must not depend on the request, since it can run on a background refresh.
+    """
+    poll_details = db.get_poll_details(poll_id)
+    seats = poll_details['seats']
+    snapshot = load_poll_ballots(poll_id)
+    candidate_text = snapshot.candidate_text
+    candidates = snapshot.candidates
+    ballot_counts = snapshot.ballot_counts
+    results = {
+        "poll_details": poll_details,
+        "seats": seats,
+        "candidate_text": candidate_text,
+        "candidates": candidates,
+        "no_votes": snapshot.total_votes == 0,
+        # Last-Modified for the results page; a later computation is needed to change them
+        "computed_at": datetime.now(timezone.utc)
+    }
+    if results["no_votes"]:
+        results["etag"] = content_tag(poll_id, poll_details, candidate_text)
+        return results
+
+    # Calculate results
+    vote_tally = {candidate: len(votes) for candidate, votes in candidates.items()}
+    vote_tally = dict(sorted(vote_tally.items(), key=lambda x: x[1], reverse=True))
+    vote_labels = [candidate_text[c] for c in vote_tally.keys()]
+
+    # Calculate using excess vote method for animation
+    # (pass a copy since the tally removes winners from candidate_counts as it goes)
+    excess_rounds_raw = get_tally_engine(TALLY_ENGINE)(seats, dict(candidates), ballot_counts, candidate_text)
+
+    # Collect winners
+    winning_set = set()
+    for round_data in excess_rounds_raw:
+        if 'winner' in round_data and round_data['winner']:
+            winning_set.add(round_data['winner'])
+
+    # Compact rounds for the animation, served by poll_results_rounds
+    rounds_json = dump_json(excess_rounds_raw.to_compact(candidate_text.keys(), vote_tally))
+
+    # Check if there's an actual tie and format appropriately
+    # Winners come grouped by the round that decided them, so a group that doesn't
+    # fit in the remaining seats is a tie
+    clear_winners = []
+    tied_candidates = []
+    for tie_group in tie_groups(excess_rounds_raw):
+        if len(clear_winners) + len(tie_group) > seats:
+            tied_candidates = tie_group
+            break
+        # All tied candidates fit within seats
+        clear_winners.extend(tie_group)
+
+    # Format the winners text based on what we found
+    if tied_candidates:
+        # There's a tie for one of the positions
+        if clear_winners:
+            # Partial tie (some clear winners, then a tie)
+            clear_winner_names = [f"<strong>{candidate_text[w]}</strong>" for w in clear_winners]
+            tied_names = [f"<strong>{candidate_text[t]}</strong>" for t in tied_candidates]
+
+            remaining_seats = seats - len(clear_winners)
+            seat_text = f"{remaining_seats} seat" if remaining_seats == 1 else f"{remaining_seats} seats"
+
+            if len(clear_winners) == 1:
+                winner_part = f"The winner of the first seat is {clear_winner_names[0]}. "
+            else:
+                winner_part = f"The winners are {', '.join(clear_winner_names[:-1])} and {clear_winner_names[-1]}. "
+
+            if len(tied_candidates) == 2:
+                tie_part = f"{tied_names[0]} and {tied_names[1]} are tied for the remaining {seat_text}."
+            else:
+                tie_part = f"{', '.join(tied_names[:-1])}, and {tied_names[-1]} are tied for the remaining {seat_text}."
+
+            winners = winner_part + tie_part
+        else:
+            # Full tie (all candidates tied for all seats)
+            winners = "There is a tie. " + format_winners_text(set(tied_candidates), candidate_text, seats, is_tie=True)
+    else:
+        # No ties
+        winners = format_winners_text(winning_set, candidate_text, seats)
+
+    # Save results
+    db.save_poll_results(poll_id, winning_set, candidate_text, vote_tally, snapshot.stored_results)
+
+    results.update({
+        "vote_tally": vote_tally,
+        "vote_labels": vote_labels,
+        "excess_rounds_raw": excess_rounds_raw,
+        "rounds_json": rounds_json,
+        "votes_needed": votes_needed_table(excess_rounds_raw, candidates, seats),
+        "winners": winners,
+        # Identifies the poll's vote version by what it renders as, so it is the same in
+        # every worker and only changes when new votes change the results
+        "etag": content_tag(poll_id, poll_details, candidate_text, vote_tally, winners, rounds_json.decode())
+    })
+    return results
+
+def get_poll_results(poll_id):
+    """Computed results for a poll, served from the results cache while its votes are unchanged"""
+    return results_cache.get_or_compute(poll_id, lambda: compute_poll_results(poll_id))
+
 @app.route("/results/<int:poll_id>")
 def poll_results_page(poll_id):
     try:
-        # Get poll details
-        poll_details = db.get_poll_details(poll_id)
-        seats = poll_details['seats']
+        results = get_poll_results(poll_id)
+        poll_details = results["poll_details"]
+        seats = results["seats"]
         title = poll_details['title']
         description = poll_details['description'] or ""
         if description:
             description = f"Poll description: {description}"
 
-        # Get vote data
-        candidate_text = db.get_candidate_text(poll_id)
-        candidates = db.get_votes_by_candidate(poll_id)
-        ballot_counts = db.get_votes_by_candidate_sets(poll_id)
-        
         # Check if there are any votes
-        total_votes = sum(len(votes) for votes in candidates.values())
-        if total_votes == 0:
+        if results["no_votes"]:
             # No votes yet - show placeholder
-            return render_template("poll_results.html.j2",
+            render = lambda: render_template("poll_results.html.j2",
                 poll_id=poll_id,
                 poll_name=title,
                 poll_description=description,
@@ -143,143 +338,88 @@ def poll_results_page(poll_id):
                 vote_labels=[],
                 vote_tally={},
                 seats=seats,
-                excess_rounds=json.dumps([]),
-                winners=""
+                winners="",
+                results_etag=results["etag"]
             )
-        
-        # Calculate results
-        vote_tally = {candidate: len(votes) for candidate, votes in candidates.items()}
-        vote_tally = dict(sorted(vote_tally.items(), key=lambda x: x[1], reverse=True))
-        vote_labels = [candidate_text[c] for c in vote_tally.keys()]
-        
-        # Calculate using excess vote method for animation
-        excess_rounds_raw = excess_vote_rounds(seats, candidates, ballot_counts, candidate_text)
-        
-        # Convert excess_rounds to JSON-serializable format
-        excess_rounds = []
-        winning_set = set()
-        for round_data in excess_rounds_raw:
-            json_round = {}
-            
-            # Collect winners
-            if 'winner' in round_data and round_data['winner']:
-                winning_set.add(round_data['winner'])
-            
-            # Convert ballot_counts (has frozenset keys)
-            if 'ballot_counts' in round_data:
-                json_round['ballot_counts'] = {
-                    str(list(ballot)): count 
-                    for ballot, count in round_data['ballot_counts'].items()
-                }
-            
-            # Convert votes_per_candidate (has set values)
-            if 'votes_per_candidate' in round_data:
-                json_round['votes_per_candidate'] = {
-                    str(cand_id): list(voters) 
-                    for cand_id, voters in round_data['votes_per_candidate'].items()
-                }
-            
-            # Copy other fields as-is
-            for key in ['winner', 'is_tie']:
-                if key in round_data:
-                    json_round[key] = round_data[key]
-            
-            excess_rounds.append(json_round)
-        
-        # Check if there's an actual tie and format appropriately
-        # Group winners by round to detect partial ties
-        clear_winners = []
-        tied_candidates = []
-        
-        # Process the excess_rounds to identify clear winners vs ties
-        processed_rounds = set()
-        for i, round_data in enumerate(excess_rounds_raw[:len(winning_set)]):
-            if i in processed_rounds:
-                continue
-                
-            # Check if this round is part of a tie
-            if round_data.get('is_tie', False):
-                # Find all rounds with the same ballot_counts (the tied group)
-                tie_group = [round_data['winner']]
-                processed_rounds.add(i)
-                
-                for j in range(i + 1, len(excess_rounds_raw)):
-                    if j < len(winning_set) and excess_rounds_raw[j].get('is_tie', False):
-                        if ('ballot_counts' in round_data and 
-                            'ballot_counts' in excess_rounds_raw[j] and
-                            round_data['ballot_counts'] == excess_rounds_raw[j]['ballot_counts']):
-                            tie_group.append(excess_rounds_raw[j]['winner'])
-                            processed_rounds.add(j)
-                
-                # If this tie group exceeds available seats, it's a tie situation
-                if len(clear_winners) + len(tie_group) > seats:
-                    tied_candidates = tie_group
-                    break
-                else:
-                    # All tied candidates fit within seats
-                    clear_winners.extend(tie_group)
-            else:
-                # Clear winner
-                clear_winners.append(round_data['winner'])
-                processed_rounds.add(i)
-                
-                if len(clear_winners) >= seats:
-                    break
-        
-        # Format the winners text based on what we found
-        if tied_candidates:
-            # There's a tie for one of the positions
-            if clear_winners:
-                # Partial tie (some clear winners, then a tie)
-                clear_winner_names = [f"<strong>{candidate_text[w]}</strong>" for w in clear_winners]
-                tied_names = [f"<strong>{candidate_text[t]}</strong>" for t in tied_candidates]
-                
-                remaining_seats = seats - len(clear_winners)
-                seat_text = f"{remaining_seats} seat" if remaining_seats == 1 else f"{remaining_seats} seats"
-                
-                if len(clear_winners) == 1:
-                    winner_part = f"The winner of the first seat is {clear_winner_names[0]}. "
-                else:
-                    winner_part = f"The winners are {', '.join(clear_winner_names[:-1])} and {clear_winner_names[-1]}. "
-                
-                if len(tied_candidates) == 2:
-                    tie_part = f"{tied_names[0]} and {tied_names[1]} are tied for the remaining {seat_text}."
-                else:
-                    tie_part = f"{', '.join(tied_names[:-1])}, and {tied_names[-1]} are tied for the remaining {seat_text}."
-                
-                winners = winner_part + tie_part
-            else:
-                # Full tie (all candidates tied for all seats)
-                winners = "There is a tie. " + format_winners_text(set(tied_candidates), candidate_text, seats, is_tie=True)
         else:
-            # No ties
-            winners = format_winners_text(winning_set, candidate_text, seats)
-
-        # Save results
-        db.save_poll_results(poll_id, winning_set, candidate_text, vote_tally)
-
-        return render_template(
-            'poll_results.html.j2',
-            winners=winners,
-            candidates=candidate_text,
-            seats=seats,
-            poll_id=poll_id,
-            vote_labels=vote_labels,
-            vote_tally=list(vote_tally.values()),
-            title=title,
-            description=description,
-            excess_rounds=excess_rounds
-        )
+            render = lambda: render_template(
+                'poll_results.html.j2',
+                winners=results["winners"],
+                candidates=results["candidate_text"],
+                seats=seats,
+                poll_id=poll_id,
+                vote_labels=results["vote_labels"],
+                vote_tally=list(results["vote_tally"].values()),
+                title=title,
+                description=description,
+                results_etag=results["etag"]
+            )
+
+        # Results change whenever votes arrive, so clients revalidate on every request
+        return conditional_response(results["etag"], render, last_modified=results["computed_at"])
 
     except Exception as err:
         print(traceback.format_exc())
         return type(err).__name__
 
+@app.route("/api/results/<int:poll_id>/rounds")
+def poll_results_rounds(poll_id):
+    """Excess vote rounds for the results page animation, in RoundHistory.to_compact's format"""
+    try:
+        results = get_poll_results(poll_id)
+    except Exception:
+        print(traceback.format_exc())
+        return {"error": "An error occurred while loading the results"}, 500
+
+    # The results page asks for ?v=<its ETag>, so those URLs always hold the same rounds and
+    # can be cached; anything else is revalidated like the page itself
+    if request.args.get("v") == results["etag"]:
+        cache_control = f"public, max-age={RESULTS_CACHE_TTL}"
+    else:
+        cache_control = "no-cache"
+    return conditional_response(
+        results["etag"],
+        lambda: Response(results.get("rounds_json", EMPTY_ROUNDS_JSON), mimetype="application/json"),
+        last_modified=results["computed_at"],
+        cache_control=cache_control
+    )
+
+@app.route("/api/results/<int:poll_id>/trace")
+def poll_results_trace(poll_id):
+    """
+    Re-run a poll's tally with a RoundTrace and return what happened in each round.
+    Bypasses the results cache. ?engine= picks a tally engine, ?format=text returns plain text.
+    """
+    if os.getenv('FLASK_ENV') != 'development' and not app.config["RESULTS_TRACE"]:
+        return {"error": "Result traces are not enabled"}, 403
+    engine = request.args.get("engine", TALLY_ENGINE)
+    if engine not in TALLY_ENGINES:
+        return {"error": f"Unknown tally engine {engine}"}, 400
+
+    try:
+        seats = db.get_poll_details(poll_id)['seats']
+        snapshot = db.get_poll_ballots(poll_id)
+        trace = RoundTrace()
+        TALLY_ENGINES[engine](seats, dict(snapshot.candidates), snapshot.ballot_counts, snapshot.candidate_text, trace=trace)
+    except Exception:
+        print(traceback.format_exc())
+        return {"error": "An error occurred while tracing the results"}, 500
+
+    if request.args.get("format") == "text":
+        return Response("\n".join(trace.lines(snapshot.candidate_text)) + "\n", mimetype="text/plain")
+    return {
+        "poll_id": poll_id,
+        "engine": engine,
+        "candidates": {str(c): text for c, text in snapshot.candidate_text.items()},
+        **trace.to_dict()
+    }
+
 @app.route("/download-votes/<int:poll_id>")
 def download_votes_csv(poll_id):
     try:
         # Get vote data and poll options
-        user_votes, option_map = db.get_votes_for_csv(poll_id)
+        snapshot = db.get_poll_snapshot(poll_id)
+        user_votes, option_map = snapshot.user_votes, snapshot.option_map
         
         # Get poll title for filename
         poll_details = db.get_poll_details(poll_id)
@@ -337,7 +477,6 @@ def download_votes_csv(poll_id):
 def compare_results():
     poll_id = request.form.get("poll_id")
     poll_option = request.form.get("poll_option")  # Single option now
-    seats = int(request.form.get("seats"))
     
     if not poll_option:
         return "<div class='text-red-600'>Please select a candidate.</div>"
@@ -347,208 +486,60 @@ def compare_results():
     selected_candidate_id = int(option_id)
     
     try:
-        # Get all candidates and their vote counts
-        candidates = db.get_votes_by_candidate(poll_id)
-        candidate_text = db.get_candidate_text(poll_id)
-        ballot_counts = db.get_votes_by_candidate_sets(poll_id)
-        
-        # Run excess_vote_rounds to get the winners in order
-        excess_rounds = excess_vote_rounds(seats, candidates, ballot_counts, candidate_text)
-        
-        # Extract winners and their vote counts from each round
-        winners_in_order = []
-        winner_votes_by_round = {}
-        selected_votes_by_round = {}
-        
-        for round_idx, round_data in enumerate(excess_rounds):
-            if 'winner' in round_data and round_data['winner']:
-                winner_id = round_data['winner']
-                winners_in_order.append(winner_id)
-                
-                # Get winner's votes in their winning round
-                if 'votes_per_candidate' in round_data and winner_id in round_data['votes_per_candidate']:
-                    winner_votes_by_round[winner_id] = len(round_data['votes_per_candidate'][winner_id])
-                
-                # Get selected candidate's votes in each round
-                if 'votes_per_candidate' in round_data and selected_candidate_id in round_data['votes_per_candidate']:
-                    selected_votes_by_round[round_idx] = len(round_data['votes_per_candidate'][selected_candidate_id])
-                elif 'ballot_counts' in round_data:
-                    # Calculate from ballot_counts if not in votes_per_candidate
-                    vote_count = 0
-                    for ballot, count in round_data['ballot_counts'].items():
-                        if selected_candidate_id in ballot:
-                            vote_count += count
-                    selected_votes_by_round[round_idx] = vote_count
-                else:
-                    selected_votes_by_round[round_idx] = 0
-        
-        # Get initial selected candidate's vote count
-        initial_selected_votes = len(candidates.get(selected_candidate_id, set()))
+        # Votes needed for every candidate are precomputed with the poll's results
+        results = get_poll_results(int(poll_id))
+        candidate_text = results["candidate_text"]
+        comparison = results.get("votes_needed", {}).get(selected_candidate_id)
+        if comparison is None:
+            comparison = {"votes": len(results["candidates"].get(selected_candidate_id, set())), "is_winner": False, "positions": []}
+        initial_selected_votes = comparison["votes"]
+        is_winner = comparison["is_winner"]
         
-        # Check if selected candidate is a winner (but don't return early - we'll handle it in the loop)
-        is_winner = selected_candidate_id in winners_in_order
-        # Calculate how many votes short for each position
         vote_differences = []
-        
-        # Group tied winners together
-        position_groups = []
-        i = 0
-        
-        # When there are ties, we need to consider ALL tied winners even if seats < number of tied winners
-        # This is important for showing "1st place (tie between X and Y)" even when only 1 seat is available
-        while i < min(len(winners_in_order), len(excess_rounds)):
-            winner_id = winners_in_order[i]
-            tied_winners = [winner_id]
-            
-            # Check if next winners are part of the same tie
-            j = i + 1
-            while j < len(winners_in_order) and j < len(excess_rounds):
-                # Check if both rounds are marked as ties and have the same ballot_counts
-                if (excess_rounds[i].get('is_tie', False) and 
-                    excess_rounds[j].get('is_tie', False) and
-                    'ballot_counts' in excess_rounds[i] and 
-                    'ballot_counts' in excess_rounds[j] and
-                    excess_rounds[i]['ballot_counts'] == excess_rounds[j]['ballot_counts']):
-                    tied_winners.append(winners_in_order[j])
-                    j += 1
-                else:
-                    break
-            
-            position_groups.append(tied_winners)
-            i = j
-        
-        # Process each position group (but only up to the number of seats)
-        for group_idx, winner_group in enumerate(position_groups[:seats]):
-            position = group_idx + 1
+        for entry in comparison["positions"]:
+            position = entry["position"]
             position_text = "1st" if position == 1 else "2nd" if position == 2 else "3rd" if position == 3 else f"{position}th"
+            winner_group = entry["winners"]
             
-            # Check if this is where the selected candidate actually won
-            if is_winner and selected_candidate_id in winner_group:
+            if entry["won"]:
                 # This is where they won! Show special message with vote breakdown
-                winner_vote_count = winner_votes_by_round.get(selected_candidate_id, initial_selected_votes)
+                winner_vote_count = entry["winner_votes"]
+                if len(winner_group) > 1:
+                    other_winners = [candidate_text[wid] for wid in winner_group if wid != selected_candidate_id]
+                    tie_text = f" (tied with {', '.join(other_winners)})"
+                else:
+                    tie_text = ""
                 
-                # Calculate vote breakdown if not first place
                 if position > 1:
-                    # Get all previous winners
-                    previous_winners = []
-                    for prev_group in position_groups[:group_idx]:
-                        previous_winners.extend(prev_group)
-                    
-                    # Calculate how many of candidate's votes also included previous winners
-                    votes_with_previous_winners = 0
-                    votes_without_previous_winners = 0
-                    
-                    selected_voters = candidates.get(selected_candidate_id, set())
-                    for voter in selected_voters:
-                        voted_for_previous_winner = False
-                        for prev_winner_id in previous_winners:
-                            if voter in candidates.get(prev_winner_id, set()):
-                                voted_for_previous_winner = True
-                                break
-                        
-                        if voted_for_previous_winner:
-                            votes_with_previous_winners += 1
-                        else:
-                            votes_without_previous_winners += 1
-                    
-                    # Build the winner message with breakdown
-                    if len(winner_group) > 1:
-                        other_winners = [candidate_text[wid] for wid in winner_group if wid != selected_candidate_id]
-                        tie_text = f" (tied with {', '.join(other_winners)})"
-                    else:
-                        tie_text = ""
-                    
+                    votes_without_previous_winners = entry["without_previous_winners"]
+                    votes_with_previous_winners = entry["with_previous_winners"]
                     vote_differences.append(f"<li><strong>{position_text} place{tie_text}: WON with {winner_vote_count} votes</strong><br>" +
                                           f"<span class='ml-4'>• {votes_without_previous_winners} vote{'s' if votes_without_previous_winners != 1 else ''} from voters who didn't vote for higher-placed winners</span><br>" +
                                           f"<span class='ml-4'>• {votes_with_previous_winners} vote{'s' if votes_with_previous_winners != 1 else ''} from voters who also voted for higher-placed winners</span></li>")
                 else:
                     # First place winner
-                    if len(winner_group) > 1:
-                        other_winners = [candidate_text[wid] for wid in winner_group if wid != selected_candidate_id]
-                        tie_text = f" (tied with {', '.join(other_winners)})"
-                    else:
-                        tie_text = ""
-                    
                     vote_differences.append(f"<li><strong>{position_text} place{tie_text}: WON with {winner_vote_count} votes</strong></li>")
-                
-                # Stop after showing where they won
-                break
+                continue
             
-            # For first position group (round 1), use initial votes
-            if group_idx == 0:
-                # Get vote count (all tied winners have same vote count)
-                winner_vote_count = winner_votes_by_round[winner_group[0]]
-                selected_vote_count = initial_selected_votes
-                votes_needed = winner_vote_count - selected_vote_count + 1  # +1 to beat, not tie
-                
-                # Build winner display text
-                if len(winner_group) == 1:
-                    winner_display = candidate_text[winner_group[0]]
-                    exclusion_text = f" who did not also vote for {candidate_text[winner_group[0]]}"
-                else:
-                    # It's a tie
-                    winner_names = [candidate_text[wid] for wid in winner_group]
-                    if len(winner_names) == 2:
-                        winner_display = f"tie between {winner_names[0]} and {winner_names[1]}"
-                        exclusion_text = f" who did not also vote for {winner_names[0]} or {winner_names[1]}"
-                    else:
-                        winner_display = f"tie between {', '.join(winner_names[:-1])}, and {winner_names[-1]}"
-                        exclusion_text = f" who did not also vote for {' or '.join(winner_names)}"
-                
-                if votes_needed > 0:
-                    vote_differences.append(f"<li>{position_text} place ({winner_display}): <strong>{votes_needed} more vote{'s' if votes_needed != 1 else ''}</strong> needed{exclusion_text}</li>")
-                else:
-                    vote_differences.append(f"<li>{position_text} place ({winner_display}): Had enough votes but lost in the tie-breaking</li>")
+            # Build winner display text
+            if len(winner_group) == 1:
+                winner_display = candidate_text[winner_group[0]]
             else:
-                # For subsequent rounds, calculate votes from ballot_counts after redistribution
-                # Get the first winner's round index (all tied winners have same round data)
-                round_idx = winners_in_order.index(winner_group[0])
-                round_data = excess_rounds[round_idx]
-                
-                # Calculate winner's actual votes from ballot_counts (all tied winners have same votes)
-                winner_vote_count = 0
-                if 'ballot_counts' in round_data:
-                    for ballot, count in round_data['ballot_counts'].items():
-                        if winner_group[0] in ballot:
-                            winner_vote_count += count
-                
-                # Calculate selected candidate's votes from ballot_counts
-                selected_vote_count = 0
-                if 'ballot_counts' in round_data:
-                    for ballot, count in round_data['ballot_counts'].items():
-                        if selected_candidate_id in ballot:
-                            selected_vote_count += count
-                
-                # Calculate the difference and round up to get whole votes needed
-                vote_difference = winner_vote_count - selected_vote_count
-                # Round up to next whole number since we need actual voters
-                votes_needed = math.ceil(vote_difference + 0.01)  # +0.01 to beat, not just tie
-                
-                # Build winner display text
-                if len(winner_group) == 1:
-                    winner_display = candidate_text[winner_group[0]]
-                else:
-                    # It's a tie
-                    winner_names = [candidate_text[wid] for wid in winner_group]
-                    if len(winner_names) == 2:
-                        winner_display = f"tie between {winner_names[0]} and {winner_names[1]}"
-                    else:
-                        winner_display = f"tie between {', '.join(winner_names[:-1])}, and {winner_names[-1]}"
-                
-                # Build the exclusion list text - include ALL winners up to this position
-                all_winners_so_far = []
-                for prev_group in position_groups[:group_idx + 1]:
-                    all_winners_so_far.extend([candidate_text[wid] for wid in prev_group])
-                
-                if len(all_winners_so_far) == 1:
-                    exclusion_text = f" who did not also vote for {all_winners_so_far[0]}"
-                else:
-                    exclusion_text = f" who did not also vote for {' or '.join(all_winners_so_far)}"
-                
-                if votes_needed > 0:
-                    vote_differences.append(f"<li>{position_text} place ({winner_display}): <strong>{votes_needed} more vote{'s' if votes_needed != 1 else ''}</strong> needed{exclusion_text}</li>")
+                # It's a tie
+                winner_names = [candidate_text[wid] for wid in winner_group]
+                if len(winner_names) == 2:
+                    winner_display = f"tie between {winner_names[0]} and {winner_names[1]}"
                 else:
-                    vote_differences.append(f"<li>{position_text} place ({winner_display}): Had enough votes but lost in the redistribution</li>")
+                    winner_display = f"tie between {', '.join(winner_names[:-1])}, and {winner_names[-1]}"
+            exclusion_text = f" who did not also vote for {' or '.join(candidate_text[wid] for wid in entry['excluded'])}"
+            
+            votes_needed = entry["votes_needed"]
+            if votes_needed > 0:
+                vote_differences.append(f"<li>{position_text} place ({winner_display}): <strong>{votes_needed} more vote{'s' if votes_needed != 1 else ''}</strong> needed{exclusion_text}</li>")
+            elif entry["redistributed"]:
+                vote_differences.append(f"<li>{position_text} place ({winner_display}): Had enough votes but lost in the redistribution</li>")
+            else:
+                vote_differences.append(f"<li>{position_text} place ({winner_display}): Had enough votes but lost in the tie-breaking</li>")
         
         # Different styling and messaging for winners vs non-winners
         if is_winner:
@@ -596,14 +587,10 @@ def new_user():
             print(f"🔄 Auto-generated preferred name: {preferred_name}")
         
         print("💾 Attempting to insert user into database...")
-        response = (
-            supabase.table("Users")
-            .insert({"email": email, "full_name": full_name, "preferred_name": preferred_name})
-            .execute()
-        )
-        print(f"✅ Database insert response: {response}")
+        user_id = db.create_user(email, full_name, preferred_name)
+        g.setdefault("user_ids", {})[email] = user_id
+        print(f"✅ Database insert succeeded")
         
-        user_id = response.data[0]['id']
         print(f"🆔 Generated user ID: {user_id}")
         
         print("📨 Attempting to send verification email...")
@@ -732,13 +719,13 @@ def new_poll(form_data=None):
         poll_data[SEATS] = int(request.form.get("seats", "0"))
         poll_data[EMAIL_VERIFICATION] = bool(request.form.get("email_verification", ""))
     try:
-        if not db.user_exists(poll_data[EMAIL]):
+        user_id = lookup_user_id(poll_data[EMAIL])
+        if user_id is None:
             db.save_form_data(poll_data)
             response = make_response(render_template("new_user_snippet.html.j2", email=poll_data[EMAIL], origin_function=NEW_POLL))
             response.headers["HX-Retarget"] = "#error-message-div"
             response.headers["HX-Swap"] = "innerHTML"
             return response
-        user_id = db.get_user_id(poll_data[EMAIL])
         if EMAIL not in session or session[EMAIL] != poll_data[EMAIL]:
             db.save_form_data(poll_data)
             # Send verification email (with timeout protection)
@@ -748,26 +735,15 @@ def new_poll(form_data=None):
             response.headers["HX-Retarget"] = "#error-message-div"
             response.headers["HX-Swap"] = "innerHTML"
             return response
-        response = (
-            supabase.table("Polls")
-            .insert({"title": poll_data[TITLE], "description": poll_data[DESCRIPTION], "cover_photo": poll_data[COVER_URL], "seats": poll_data[SEATS], "email_verification": poll_data[EMAIL_VERIFICATION]})
-            .execute()
-        )
-        # print(f"insert poll response: {response}")
-        poll_id = response.data[0]['id']
-        response = (
-            supabase.table("PollAdmins")
-            .insert({"poll": poll_id, "user": user_id})
-            .execute()
+        poll_id = db.create_poll_with_options(
+            user_id,
+            poll_data[TITLE],
+            poll_data[DESCRIPTION],
+            poll_data[COVER_URL],
+            poll_data[SEATS],
+            poll_data[EMAIL_VERIFICATION],
+            poll_data[CANDIDATES]
         )
-        # print(f"insert poll admin response: {response}")
-        for candidate in poll_data[CANDIDATES]:
-            response = (
-                supabase.table("PollOptions")
-                .insert({"option": candidate, "poll": poll_id})
-                .execute()
-            )
-            # print(f"insert candidate {candidate} response: {response}")
         return render_template("make_poll_success.html.j2", poll_id=poll_id, preview_title=poll_data[TITLE], preview_description=poll_data[DESCRIPTION], thumbnail_preview_url=poll_data[COVER_URL])
     except Exception as err:
         print(traceback.format_exc())
@@ -790,16 +766,16 @@ def delete_poll_api(poll_id):
             return {"error": "Email is required"}, 400
         
         # Check if user exists
-        user_id = db.get_user_id(email)
+        user_id = lookup_user_id(email)
         if not user_id:
             return {"error": "User not found"}, 404
         
-        # Check if poll exists
-        if not db.poll_exists(poll_id):
+        # Delete the poll if the user administers it, in one database call
+        result = db.delete_polls([poll_id], user_id)
+        if poll_id in result["missing"]:
             return {"error": "Poll not found"}, 404
-        
-        # Delete the poll (this will check admin permissions)
-        db.delete_poll(poll_id, user_id)
+        if poll_id not in result["deleted"]:
+            return {"error": "User is not authorized to delete this poll"}, 403
         
         # Check if this is an HTMX request
         if request.headers.get('HX-Request'):
@@ -814,6 +790,36 @@ def delete_poll_api(poll_id):
         print(traceback.format_exc())
         return {"error": "An error occurred while deleting the poll"}, 500
 
+@app.route("/api/polls/delete", methods=["POST"])
+def delete_polls_api():
+    """Delete the dashboard's selected polls (poll_id form values) that the signed-in user administers"""
+    if EMAIL not in session:
+        return {"error": "Authentication required"}, 401
+    
+    try:
+        poll_ids = [int(poll_id) for poll_id in request.form.getlist("poll_id")]
+    except ValueError:
+        return {"error": "Invalid poll ID"}, 400
+    if not poll_ids:
+        return {"error": "Select at least one poll"}, 400
+    
+    try:
+        user_id = lookup_user_id(session[EMAIL])
+        if not user_id:
+            return {"error": "User not found"}, 404
+        result = db.delete_polls(poll_ids, user_id)
+        
+        # Reload the dashboard so the deleted polls disappear
+        if request.headers.get('HX-Request'):
+            response = make_response("")
+            response.headers["HX-Refresh"] = "true"
+            return response
+        return {"deleted": result["deleted"], "missing": result["missing"]}, 200
+        
+    except Exception:
+        print(traceback.format_exc())
+        return {"error": "An error occurred while deleting the polls"}, 500
+
 @app.route("/poll/<int:poll_id>/delete-confirm")
 def poll_delete_confirm(poll_id):
     """Return confirmation dialog for poll deletion"""
@@ -828,7 +834,7 @@ def poll_delete_confirm(poll_id):
             return "Poll not found", 404
         
         # Check if user is authorized to delete this poll
-        user_id = db.get_user_id(session[EMAIL])
+        user_id = lookup_user_id(session[EMAIL])
         if not db.is_poll_admin(poll_id, user_id):
             return "Not authorized to delete this poll", 403
         
@@ -871,34 +877,12 @@ def poll_cancel_delete(poll_id):
     
     try:
         # Get poll info to restore the original view
-        poll = db.get_poll_details(poll_id)
-        if not poll:
+        user_id = lookup_user_id(session[EMAIL])
+        polls = db.get_user_polls(user_id, poll_id=poll_id)
+        if not polls:
             return "Poll not found", 404
         
-        return f"""
-        <div id="poll-{poll_id}" class="bg-gray-50 rounded-3xl p-4 border border-gray-300">
-          <div class="flex justify-between items-start gap-6">
-            <div class="flex-1">
-              <h2 class="text-xl font-medium mb-3">{poll['title']}</h2>
-              {'<p class="text-gray-600 mb-4">' + poll['description'] + '</p>' if poll.get('description') else ''}
-              <p class="text-sm text-gray-500">Created: {poll['created_at'][:10] if poll.get('created_at') else 'Unknown'}</p>
-            </div>
-            <div class="flex gap-4 flex-shrink-0">
-              <button hx-get="/poll/{poll_id}/delete-confirm" 
-                      hx-target="#poll-{poll_id}"
-                      class="text-red-600 hover:text-red-800 font-medium">
-                Delete
-              </button>
-              <a href="/vote/{poll_id}" class="text-blue-600 hover:text-blue-800 font-medium">
-                Vote
-              </a>
-              <a href="/results/{poll_id}" class="text-blue-600 hover:text-blue-800 font-medium">
-                Results
-              </a>
-            </div>
-          </div>
-        </div>
-        """
+        return render_template("dashboard_poll_snippet.html.j2", poll=polls[0])
         
     except Exception as e:
         print(traceback.format_exc())
@@ -944,7 +928,6 @@ def delete_user_api():
 @app.route("/api/test/verification-code", methods=["GET"])
 def get_test_verification_code():
     """Get the last verification code (TEST ONLY - only works in development)"""
-    import os
     if os.getenv('FLASK_ENV') != 'development':
         return {"error": "This endpoint is only available in development mode"}, 403
     
@@ -967,11 +950,10 @@ def login_submit():
     
     try:
         # Check if user exists
-        if not db.user_exists(email):
+        user_id = lookup_user_id(email)
+        if user_id is None:
             return "No account found with this email address. Please create a poll first to register."
         
-        user_id = db.get_user_id(email)
-        
         # Send verification email
         verification_code = email_service.send_verification_email(email)
         session[VERIFICATION_CODE] = verification_code
@@ -990,9 +972,12 @@ def dashboard():
         return redirect("/login")
     
     try:
-        user_id = db.get_user_id(session[EMAIL])
-        polls = db.get_user_polls(user_id)
-        return render_template('dashboard.html.j2', polls=polls)
+        user_id = lookup_user_id(session[EMAIL])
+        before = request.args.get("before", type=int)
+        # One extra poll tells whether there is an older page
+        polls = db.get_user_polls(user_id, before=before, limit=DASHBOARD_PAGE_SIZE + 1)
+        next_before = polls[DASHBOARD_PAGE_SIZE - 1]["id"] if len(polls) > DASHBOARD_PAGE_SIZE else None
+        return render_template('dashboard.html.j2', polls=polls[:DASHBOARD_PAGE_SIZE], before=before, next_before=next_before)
     except Exception as err:
         print(traceback.format_exc())
         return f"Error loading dashboard: {type(err).__name__}"